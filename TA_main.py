@@ -1,7 +1,6 @@
 from pathlib import Path
 
 import numpy as np
-from sklearn.compose import ColumnTransformer
 # import umap
 from sklearn.feature_selection import (SelectKBest, VarianceThreshold,
                                        f_regression)
@@ -12,7 +11,8 @@ from utils.aes import LeakageModel, get_aes_output_for_leakage
 from utils.data import load_data
 from utils.feature_selection import SumOfDifferenceFeatureSelector
 from utils.measure import guessing_entropy_and_success_rate
-from utils.sklearn_wrappers import TransformedTargetTransformer
+from utils.sklearn_wrappers import (TraceData, TracesTransformer,
+                                    TransformedTargetTransformer)
 from utils.TA import TemplateAttack
 
 DATA_ROOT = Path("data")
@@ -36,11 +36,11 @@ train, test = load_data(DATA_ROOT/DATASET, TARGET_BYTE)
 (tracesTrain, ptTrain, keyTrain) = train
 (tracesTest, ptTest, keyTest) = test
 
-# X = (traces | plain_text)
+# X = traces with plain_text side channel
 # y = key
-X_train = np.hstack((tracesTrain, ptTrain.reshape(-1, 1)))
+X_train = TraceData(tracesTrain, ptTrain)
 y_train = keyTrain
-X_test = np.hstack((tracesTest, ptTest.reshape(-1, 1)))
+X_test = TraceData(tracesTest, ptTest)
 y_test = keyTest
 
 ########################################################################
@@ -68,14 +68,11 @@ transformerPipe = Pipeline([
 ])
 
 
-tracesTransformer = ColumnTransformer(
-    transformers=[("ct", transformerPipe, slice(-1))],
-    remainder="passthrough"
-)
+tracesTransformer = TracesTransformer(transformerPipe)
 
 
 def transform_key_to_output(X, y):
-    plain = X[:, -1].astype(np.int8)
+    plain = X.plaintext.astype(np.uint8)
     key = y
     return output_fn(plain, key)
 
@@ -98,11 +95,11 @@ def ge_scoring(clf, X, y, number_of_experiments):
     scores = clf.predict_proba(X)
 
     # compute measures (GE and SR)
-    np.random.seed(43)
     ge, sr = guessing_entropy_and_success_rate(
         scores,
         y[0],
-        number_of_experiments=number_of_experiments)
+        number_of_experiments=number_of_experiments,
+        random_state=43)
 
     return ge[-1]
 
@@ -110,7 +107,7 @@ def ge_scoring(clf, X, y, number_of_experiments):
 search = GridSearchCV(
     pipe,
     param_grid={
-        "tracesTransformer__ct__dim_rdc__feature_spacing": [1, 2, 3, 4]
+        "tracesTransformer__dim_rdc__feature_spacing": [1, 2, 3, 4]
     },
     cv=5,
     verbose=3,
@@ -123,11 +120,11 @@ scores = search.predict_proba(X_test)
 
 
 # compute measures (GE and SR)
-np.random.seed(43)
 ge, sr = guessing_entropy_and_success_rate(
     scores,
     y_train[0],
-    number_of_experiments=GE_NUMBER_OF_EXPERIMENTS
+    number_of_experiments=GE_NUMBER_OF_EXPERIMENTS,
+    random_state=43
 )
 
 
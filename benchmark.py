@@ -0,0 +1,283 @@
+"""Benchmarks of hot paths on synthetic traces (no dataset files needed).
+
+Usage:
+    python benchmark.py                  # compare with stored baseline
+    python benchmark.py --save-baseline  # store timings as new baseline
+    python benchmark.py --quick --only ta_  # smallest sizes, selected benchmarks
+
+Every benchmark is run for sizes of its sweep, timing is the minimum of
+REPEATS runs (setup, e.g. generating traces, is not timed). Timings that
+are slower than baseline by more than tolerance (and MIN_REGRESSION_SECONDS)
+are reported as regressions and the script exits with status 1.
+Baselines are machine specific, store one on every machine that is used
+for comparisons.
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import warnings
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from utils.aes import LeakageModel, get_aes_output_for_leakage
+from utils.data import generate_synthetic_data, load_data, write_synthetic_data
+from utils.feature_selection import SumOfDifferenceFeatureSelector
+from utils.measure import guessing_entropy_and_success_rate
+from utils.neighbors import NeighborsGraph
+from utils.reducers import REDUCERS, make_reducer, reducer_parameters
+from utils.sklearn_wrappers import TraceData
+from utils.TA import TemplateAttack
+
+BASELINE_FILE = Path("benchmarks")/"baseline.json"
+REPEATS = 3
+TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.01
+
+N_FEATURES = 700
+N_REDUCED_FEATURES = 50
+RANDOM_STATE = 0
+
+
+def _data(n_profiling, n_attack, n_features, leakage_model=LeakageModel.HW, dtype=np.float32):
+    return generate_synthetic_data(
+        n_profiling, n_attack, n_features, leakage_model=leakage_model,
+        leakage_positions=np.arange(n_features // 2, n_features // 2 + 5),
+        dtype=dtype, target_byte=0, random_state=RANDOM_STATE
+    )
+
+
+############################### benchmarks ####################################
+# every benchmark gets size of sweep and returns function that is timed
+
+def bench_ta_fit(n_traces):
+    (traces, plain, key), _ = _data(n_traces, 1, 20)
+    X = TraceData(traces.astype(np.float64), plain)
+    ta = TemplateAttack(get_aes_output_for_leakage(LeakageModel.HW))
+    return lambda: ta.fit(X, key)
+
+
+def bench_ta_score(n_traces):
+    (traces, plain, key), (attack_traces, attack_plain, _) = _data(5000, n_traces, 20)
+    ta = TemplateAttack(get_aes_output_for_leakage(LeakageModel.HW))
+    ta.fit(TraceData(traces.astype(np.float64), plain), key)
+    X = TraceData(attack_traces.astype(np.float64), attack_plain)
+    return lambda: ta.predict_proba(X)
+
+
+def bench_sod_fit(n_traces):
+    (traces, plain, key), _ = _data(n_traces, 1, N_FEATURES, LeakageModel.intermediate)
+    output = get_aes_output_for_leakage(LeakageModel.intermediate)(plain, key)
+    selector = SumOfDifferenceFeatureSelector(n_components=50, feature_spacing=2)
+    return lambda: selector.fit(traces, output)
+
+
+def bench_ge_sr(n_traces):
+    rng = np.random.default_rng(RANDOM_STATE)
+    scores = np.log(rng.dirichlet(np.ones(256), n_traces))
+    return lambda: guessing_entropy_and_success_rate(
+        scores, 0, number_of_experiments=100, random_state=RANDOM_STATE)
+
+
+def _bench_loader(dataset, file_format, n_traces):
+    data = generate_synthetic_data(
+        n_traces, 1000, N_FEATURES, dtype=np.int8, random_state=RANDOM_STATE)
+    directory = tempfile.TemporaryDirectory()
+    path = Path(directory.name)/dataset
+    indexes = write_synthetic_data(path, data, file_format)
+
+    def load():
+        return load_data(path, 0, **indexes)
+
+    # files are removed when benchmark function is released
+    load.directory = directory
+    return load
+
+
+def bench_load_chipwhisperer(n_traces):
+    return _bench_loader("chipwhisperer", "chipwhisperer", n_traces)
+
+
+def bench_load_ascad(n_traces):
+    return _bench_loader("ascad_fixed", "ascad", n_traces)
+
+
+# reducer of utils.reducers.REDUCERS -> (parameters, sizes of sweep),
+# every reducer of registry is benchmarked, reducers that are not listed
+# get only DEFAULT_REDUCER_SIZES (and n_neighbors if they use neighbors)
+REDUCER_BENCHMARKS = {
+    "sod":              ({"feature_spacing": 2},                            [5000, 20000, 50000]),
+    "pca":              ({},                                                [1000, 4000, 10000]),
+    "lda":              ({"shrinkage": 1e-3},                               [5000, 20000, 50000]),
+    "class_means":      ({},                                                [5000, 20000, 50000]),
+    "hlle":             ({"n_components": 5, "n_neighbors": 25, "eigen_solver": "dense"},
+                         [1000, 2000, 4000]),
+    "landmark_isomap":  ({"n_landmarks": 1000, "random_state": RANDOM_STATE}, [2000, 4000, 10000]),
+    "landmark_lle":     ({"n_landmarks": 1000, "random_state": RANDOM_STATE}, [2000, 4000, 10000]),
+    "landmark_ltsa":    ({"n_landmarks": 1000, "random_state": RANDOM_STATE}, [2000, 4000, 10000]),
+    "umap":             ({"random_state": RANDOM_STATE},                    [1000, 2000, 4000]),
+}
+DEFAULT_REDUCER_SIZES = [1000, 2000, 4000]
+
+# reducers fitted with output classes (on all features of traces)
+SUPERVISED_REDUCERS = {"sod", "lda", "class_means"}
+
+
+def _bench_reducer(name, params, n_traces):
+    # imports implementation of reducer (ImportError if optional
+    # dependency, e.g. umap, is missing)
+    param_names = reducer_parameters(name)
+    params = {"n_components": 10, **params}
+    if "n_neighbors" in param_names:
+        params.setdefault("n_neighbors", 20)
+
+    if name in SUPERVISED_REDUCERS:
+        (traces, plain, key), (attack_traces, _, _) = _data(
+            n_traces, 1000, N_FEATURES, LeakageModel.intermediate)
+        output = get_aes_output_for_leakage(LeakageModel.intermediate)(plain, key)
+    else:
+        (traces, _, _), (attack_traces, _, _) = _data(
+            n_traces, 1000, N_REDUCED_FEATURES, dtype=np.float64)
+        output = None
+
+    def fit_transform():
+        # manifold reducers get new NeighborsGraph in every run, so
+        # computing neighbors is timed too
+        reducer_params = dict(params)
+        if "neighbors_graph" in param_names:
+            reducer_params["neighbors_graph"] = NeighborsGraph()
+        reducer = make_reducer(name, reducer_params)
+        if output is None:
+            reducer.fit(traces)
+        else:
+            reducer.fit(traces, output)
+        return reducer.transform(attack_traces)
+
+    return fit_transform
+
+
+# name -> (benchmark, sizes of sweep)
+BENCHMARKS = {
+    "ta_fit":               (bench_ta_fit,              [5000, 20000, 100000]),
+    "ta_score":             (bench_ta_score,            [1000, 5000, 20000]),
+    "sod_fit":              (bench_sod_fit,             [5000, 20000, 50000]),
+    "ge_sr":                (bench_ge_sr,               [500, 2000, 5000]),
+    "load_chipwhisperer":   (bench_load_chipwhisperer,  [10000, 50000]),
+    "load_ascad":           (bench_load_ascad,          [10000, 50000]),
+}
+BENCHMARKS.update({
+    name: (partial(_bench_reducer, name, params), sizes)
+    for name in REDUCERS
+    for params, sizes in [REDUCER_BENCHMARKS.get(name, ({}, DEFAULT_REDUCER_SIZES))]
+})
+
+
+def time_benchmark(benchmark, size, repeats=REPEATS):
+    function = benchmark(size)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_benchmarks(names, quick=False, repeats=REPEATS):
+    """Timings of benchmarks, {name: {size: seconds}}."""
+    results = {}
+    for name in names:
+        benchmark, sizes = BENCHMARKS[name]
+        for size in sizes[:1] if quick else sizes:
+            try:
+                seconds = time_benchmark(benchmark, size, repeats)
+            except ImportError as e:
+                # optional dependency (umap) is not installed
+                print(f"{name:<20} skipped: {e}")
+                break
+            results.setdefault(name, {})[str(size)] = seconds
+            print(f"{name:<20} {size:>8} {seconds:10.4f} s")
+    return results
+
+
+def find_regressions(results, baseline, tolerance=TOLERANCE):
+    """(name, size, seconds, baseline seconds) of timings slower than
+    baseline by more than tolerance (relative) and MIN_REGRESSION_SECONDS."""
+    regressions = []
+    for name, timings in results.items():
+        for size, seconds in timings.items():
+            baseline_seconds = baseline.get(name, {}).get(size)
+            if baseline_seconds is None:
+                continue
+            if (seconds > baseline_seconds * (1 + tolerance)
+                    and seconds - baseline_seconds > MIN_REGRESSION_SECONDS):
+                regressions.append((name, size, seconds, baseline_seconds))
+    return regressions
+
+
+def machine_description():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of hot paths on synthetic traces.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE,
+                        help="baseline file (default %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store timings as baseline (timings of other benchmarks are kept)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed relative slowdown (default %(default)s)")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--quick", action="store_true", help="run only smallest sizes")
+    parser.add_argument("--only", nargs="*", default=[],
+                        help="run only benchmarks whose names start with one of these")
+    args = parser.parse_args()
+
+    names = [
+        name for name in BENCHMARKS
+        if not args.only or any(name.startswith(prefix) for prefix in args.only)
+    ]
+
+    warnings.filterwarnings("ignore")
+    results = run_benchmarks(names, args.quick, args.repeats)
+
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else None
+
+    if args.save_baseline:
+        baseline = stored["results"] if stored else {}
+        for name, timings in results.items():
+            baseline.setdefault(name, {}).update(timings)
+
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(
+            {"machine": machine_description(), "results": baseline}, indent=1))
+        print("Baseline saved to", args.baseline)
+        return 0
+
+    if stored is None:
+        print("No baseline in", args.baseline, "(run with --save-baseline)")
+        return 0
+
+    if stored["machine"] != machine_description():
+        print("Warning: baseline was measured on different machine:", stored["machine"])
+
+    regressions = find_regressions(results, stored["results"], args.tolerance)
+    for name, size, seconds, baseline_seconds in regressions:
+        print(f"REGRESSION {name} {size}: {seconds:.4f} s, baseline {baseline_seconds:.4f} s "
+              f"({seconds / baseline_seconds:.2f}x)")
+    if not regressions:
+        print("No regressions.")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
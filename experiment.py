@@ -1,42 +1,87 @@
-from utils.sklearn_wrappers import TransformedTargetTransformer
+from utils.sklearn_wrappers import (ProfiledEstimator, TraceData, TracesTransformer,
+                                    TransformedTargetTransformer)
 import numpy as np
-from sklearn.feature_selection import SelectKBest, f_regression, VarianceThreshold
-from sklearn.model_selection import GridSearchCV
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import GridSearchCV, check_cv
 from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
 
+from utils.class_statistics import FoldStatistics
+from utils.feature_selection import StatisticsFeatureSelector
 from utils.measure import guessing_entropy_and_success_rate, make_ge_scoring
+from utils.profiling import profile_stage
+from utils.stage_cache import CachedTransformer, StageCache
 from utils.TA import TemplateAttack
 
+CV_FOLDS = 5
+STAGE_CACHE_BYTES = 2**30
 
-def run_experiment(data, output_fn, dim_rdc, dim_rdc_param_grid, n_experiments):
+
+def _profiled(estimator, profiler, name, folds=None):
+    # steps are wrapped only when profiling, so disabled profiling costs
+    # nothing
+    if profiler is None:
+        return estimator
+    return ProfiledEstimator(estimator, profiler, name, folds)
+
+
+def run_experiment(data, output_fn, dim_rdc, dim_rdc_param_grid, n_experiments,
+                   profiler=None, random_state=43):
+    """Profiles template attack with dim_rdc (grid search over
+    dim_rdc_param_grid if given) and attacks test traces.
+
+    If profiler (utils.profiling.Profiler) is given, every pipeline step,
+    template attack and GE computation is recorded for every CV fold
+    (refit is fold "all", attack of test traces is fold "attack").
+
+    GE experiments of grid search scoring and of the attack use
+    random_state, so results are the same in every run.
+
+    Returns:
+        (np.ndarray, np.ndarray, GridSearchCV): GE, SR and grid search
+            (None if dim_rdc_param_grid is None)
+    """
 
     # Unpack data
     ((tracesTrain, ptTrain, keyTrain),
      (tracesTest, ptTest, keyTest)) = data
 
     # Prepare data
-    ##  X = (traces | plain_text)
+    ##  X = traces with plain_text side channel (traces keep their dtype)
     ##  y = key
-    X_train = np.hstack((tracesTrain, ptTrain.reshape(-1, 1)))
+    X_train = TraceData(tracesTrain, ptTrain)
     y_train = keyTrain
-    X_test = np.hstack((tracesTest, ptTest.reshape(-1, 1)))
+    X_test = TraceData(tracesTest, ptTest)
     y_test = keyTest
 
+    # CV folds (same as GridSearchCV default for classifiers)
+    cv_splits = list(
+        check_cv(CV_FOLDS, y_train, classifier=True).split(X_train, y_train)
+    )
+
+    # class statistics of every fold are computed only once and reused
+    # by feature selection for every grid point
+    fold_statistics = FoldStatistics(
+        tracesTrain, output_fn(ptTrain, keyTrain), cv_splits
+    )
+
+    # fitted feature selection and its outputs don't depend on dim_rdc
+    # params, so they are reused for every grid point
+    stage_cache = StageCache(max_bytes=STAGE_CACHE_BYTES)
+
     # Build model
+    ##  feature_sel = VarianceThreshold + SelectKBest(f_regression, k=300)
+    feature_sel = StatisticsFeatureSelector(k=300, fold_statistics=fold_statistics)
     tracesTransformer = Pipeline([
-        ("var",             VarianceThreshold()),
-        ("feature_sel",     SelectKBest(f_regression, k=300)),
-        ("dim_rdc",         dim_rdc)
+        ("feature_sel",     _profiled(CachedTransformer(feature_sel, stage_cache),
+                                      profiler, "feature_sel")),
+        ("dim_rdc",         _profiled(dim_rdc, profiler, "dim_rdc"))
     ])
 
-    tracesTransformer = ColumnTransformer(
-        transformers=[("ct", tracesTransformer, slice(-1))],
-        remainder="passthrough"
-    )
+    tracesTransformer = TracesTransformer(tracesTransformer)
 
     def transform_key_to_output(X, y):
-        plain = X[:, -1].astype(np.int8)
+        plain = X.plaintext.astype(np.uint8)
         key = y
         return output_fn(plain, key)
 
@@ -47,8 +92,9 @@ def run_experiment(data, output_fn, dim_rdc, dim_rdc_param_grid, n_experiments):
 
     model = Pipeline([
         ("tracesTrans", tracesTransformer),
-        ("TA",  TemplateAttack(output_fn))
+        ("TA",  _profiled(TemplateAttack(output_fn), profiler, "TA"))
     ])
+    model = _profiled(model, profiler, "pipeline", folds=fold_statistics)
 
 
     gridSearch_res = None
@@ -56,16 +102,17 @@ def run_experiment(data, output_fn, dim_rdc, dim_rdc_param_grid, n_experiments):
     if dim_rdc_param_grid is not None:
 
         param_grid = {
-            f"tracesTrans__ct__dim_rdc__{k}": v
+            f"tracesTrans__dim_rdc__{k}": v
             for k, v in dim_rdc_param_grid.items()
         }
 
         model = GridSearchCV(
             model,
             param_grid=param_grid,
-            cv=5,
+            cv=cv_splits,
             verbose=3,
-            scoring=make_ge_scoring(n_experiments)
+            scoring=make_ge_scoring(n_experiments, random_state=random_state,
+                                    profiler=profiler)
 
         )
         
@@ -79,13 +126,86 @@ def run_experiment(data, output_fn, dim_rdc, dim_rdc_param_grid, n_experiments):
         gridSearch_res = model
 
     # Attack
+    if profiler is not None:
+        profiler.fold = "attack"
     scores = model.predict_proba(X_test)
 
     # compute measures (GE and SR)
-    ge, sr = guessing_entropy_and_success_rate(
-        scores,
-        y_train[0],
-        number_of_experiments=n_experiments
-    )
+    with profile_stage(profiler, "ge"):
+        ge, sr = guessing_entropy_and_success_rate(
+            scores,
+            y_train[0],
+            number_of_experiments=n_experiments,
+            random_state=random_state
+        )
 
     return ge, sr, gridSearch_res
+
+
+def _attack_byte(profiling_traces, profiling_plain, profiling_key,
+                 attack_traces, attack_plain, output_fn, dim_rdc, random_state):
+
+    output = output_fn(profiling_plain, profiling_key)
+
+    dim_rdc = clone(dim_rdc)
+    if "random_state" in dim_rdc.get_params():
+        dim_rdc.set_params(random_state=random_state)
+
+    # Profiling
+    tracesTransformer = Pipeline([
+        ("feature_sel",     StatisticsFeatureSelector(k=300)),
+        ("dim_rdc",         dim_rdc)
+    ])
+    ta = TemplateAttack(output_fn)
+    ta.create_template(
+        tracesTransformer.fit_transform(profiling_traces, output),
+        output=output
+    )
+
+    # Attack
+    logpdfs = ta.logpdfs(tracesTransformer.transform(attack_traces), attack_plain)
+
+    return logpdfs.sum(axis=0)
+
+
+def run_multi_byte_experiment(data, output_fn, dim_rdc, target_bytes=range(16), n_jobs=None,
+                              random_state=43):
+    """Attacks all target bytes of key with traces loaded once.
+
+    data must contain plaintext and key of all bytes (loaded without
+    target_byte). Constant features are removed once for all bytes, while
+    feature selection, dim_rdc and templates are fitted for every byte
+    (bytes are processed in parallel by n_jobs workers). Randomized
+    dim_rdc (with random_state parameter) gets its own seed spawned from
+    random_state for every byte, so results don't depend on n_jobs.
+
+    Returns:
+        np.ndarray: log likelihoods of all key guesses for every target
+            byte, shape (len(target_bytes), 256)
+    """
+
+    # Unpack data
+    ((tracesTrain, ptTrain, keyTrain),
+     (tracesTest, ptTest, keyTest)) = data
+
+    # features that are constant don't depend on target byte (ptp would
+    # overflow in integer dtype of traces)
+    non_constant = np.flatnonzero(tracesTrain.max(axis=0) != tracesTrain.min(axis=0))
+    tracesTrain = tracesTrain[:, non_constant]
+    tracesTest = tracesTest[:, non_constant]
+
+    target_bytes = list(target_bytes)
+    seeds = [
+        int(seed.generate_state(1)[0])
+        for seed in np.random.SeedSequence(random_state).spawn(len(target_bytes))
+    ]
+
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(_attack_byte)(
+            tracesTrain, ptTrain[:, target_byte], keyTrain[:, target_byte],
+            tracesTest, ptTest[:, target_byte],
+            output_fn, dim_rdc, seed)
+        for target_byte, seed in zip(target_bytes, seeds)
+    )
+
+    return np.array(scores)
@@ -1,234 +1,370 @@
 import os
+import sys
+import time
+from collections import namedtuple
 from datetime import datetime
-from math import floor
 from pathlib import Path
 
-import umap  # takes a bit to import
-from sklearn import manifold
-from sklearn.decomposition import PCA
-
-from experiment import run_experiment
-from utils.aes import LeakageModel, get_aes_output_for_leakage
-from utils.data import load_data
-from utils.feature_selection import SumOfDifferenceFeatureSelector
+from utils.aes import get_aes_output_for_leakage
+from utils.data import load_data, select_traget_bype
+from utils.experiment_spec import configuration_n_neighbors, load_spec, reducer_configurations
+from utils.profiling import Profiler
+from utils.neighbors import neighbors_index_bytes
+from utils.reducers import clear_shared_neighbors_graph, make_reducer, preload
+from utils.results_store import ResultsStore, cv_results_arrays
+from utils.run_manifest import RunManifest, stable_hash, write_atomic
+from utils.scheduler import (SharedArrays, attach_arrays, available_memory, run_tasks,
+                             workers_for_memory)
 
 PREVIEW = False
 
-DATA_ROOT = Path("data")
-TARGET_BYTE = 0
-
-GE_N_EXPERIMENTS = 100
-
-
-datasets = [
-    #"chipwhisperer",
-    "ascad_fixed",
-    "ascad_variable",
-    "ches_ctf"
-]
-
-leakage_models = [
-    LeakageModel.intermediate,
-    LeakageModel.HW
-]
-
-
-######################## manifold transform parameters ########################
-# for MLLE: n_neighbors >= n_components
-# for HLLE: n_neighbors > n_components * (n_components + 3) / 2
-mf_parameters_dict = {
-    "n_components": {
-        10: {"n_neighbors": [20, 50, 200]},
-        25: {"n_neighbors": [50, 125, 500]},
-        50: {"n_neighbors": [100, 250, 1000]},
-        75: {"n_neighbors": [150, 375, 1500]},
-        100: {"n_neighbors": [200, 500, 2000]},
-    },
-}
-
-mf_n_components = mf_parameters_dict["n_components"].keys()
-mf_n_jobs = None
-
-############################ SumOfDifference parameters #######################
-sod_n_components = mf_n_components
-sod_feature_spacing = 5
-
+# datasets, target bytes, leakage models, reductors and their grids of
+# experiments (spec file can be also given as first argument)
+SPEC_FILE = Path("experiments.json")
 
-################################ PCA parameters ###############################
-pca_n_components = mf_n_components
-
-################################ end parameters ###############################
-
-
-def generate_manifold_tranformations(n_components):
-
-    isomap_clf = manifold.Isomap(
-        n_components=n_components,
-        n_jobs=mf_n_jobs
-    )
-
-    lle_clf = manifold.LocallyLinearEmbedding(
-        n_components=n_components,
-        method='standard',
-        n_jobs=mf_n_jobs
-    )
-
-    mlle_clf = manifold.LocallyLinearEmbedding(
-        n_components=n_components,
-        method='modified',
-        n_jobs=mf_n_jobs
-    )
+# if PROFILE, time and memory of every stage (loaders, pipeline steps in
+# every CV fold, GE) are stored with results (off by default, it adds
+# overhead to every step), allocations are traced with tracemalloc only
+# if PROFILE_ALLOCATIONS (it slows experiments down a lot)
+PROFILE = False
+PROFILE_ALLOCATIONS = False
 
-    # hlle_clf = manifold.LocallyLinearEmbedding(
-    #     n_components=n_components,
-    #     method='hessian',
-    #     n_jobs=mf_n_jobs
-    # )
 
-    ltsa_clf = manifold.LocallyLinearEmbedding(
-        n_components=n_components,
-        method='ltsa',
-        n_jobs=mf_n_jobs
-    )
-
-    umap_clf = umap.UMAP(
-        n_components=n_components,
-    )
-
-    # manifold transformations
-    trans_clfs = [
-        (isomap_clf, "isomap"),
-        (lle_clf, "lle"),
-        (mlle_clf, "mlle"),
-        # (hlle_clf, "hlle"),
-        (ltsa_clf, "ltsa"),
-        (umap_clf, "umap"),
-    ]
-
-    return trans_clfs
-
-
-def generate_all_dim_reductors():
-    """This function generates all dimensionality reduction algorithms
-    that are used for all experiments. Dimensionality reductor is a tuple 
-    consisting of transformer object and its name. 
-
-    Yields:
-        (transformer, str, dict): a tuple with transformer, its short name and param_dict
-    """
-
-    # # SumOfDifference dimensionality reductors (TA default reductor)
-    for n_components in sod_n_components:
-
-        sod_dim_rdc = SumOfDifferenceFeatureSelector(
-            n_components=n_components,
-            feature_spacing=min(floor(100 / n_components), 5)
-        )
-        yield (sod_dim_rdc, f"sod_{n_components}", None)
-
-    # # PCA (probably good idea to test it as well)
-    for n_components in pca_n_components:
-        pca_dim_rdc = PCA(n_components=n_components)
-        yield (pca_dim_rdc, f"pca_{n_components}", None)
-
-    # all manifold reductors
-    for n_components in mf_n_components:
-
-        manifold_dim_rds = generate_manifold_tranformations(
-            n_components=n_components
+################################### main ######################################
+# experiments run on pool of N_WORKERS processes (None to run them one by
+# one in this process, "auto" to run as many as fit into MEMORY_FRACTION
+# of available memory, see task_memory_bytes), workers together use
+# N_THREADS BLAS threads (all cpus if None)
+N_WORKERS = "auto"
+N_THREADS = None
+MEMORY_FRACTION = 0.75
+
+# memory of worker besides stage cache and neighbors graphs (imported
+# modules, traces of folds, fold statistics, templates)
+WORKER_BASE_BYTES = 2**29
+
+# name of run directory in results/ to resume (finished experiments of
+# interrupted run are skipped), None to start new run
+RESUME_RUN = None
+
+ExperimentTask = namedtuple(
+    "ExperimentTask",
+    ["key", "dataset", "target_byte", "leakage_model", "dim_rdc_name", "reducer",
+     "reducer_params", "param_dict", "max_n_neighbors", "ge_n_experiments", "data"]
+)
+
+
+def experiment_key(spec, dataset, target_byte, leakage_model, dim_rdc_name, reducer,
+                   reducer_params, param_dict, dataset_size):
+    """Identifier of experiment that is the same in every run."""
+    return stable_hash({
+        "dataset": dataset,
+        "target_byte": target_byte,
+        "data_slices": spec["data_slices"],
+        "dataset_size": dataset_size,
+        "leakage_model": leakage_model.name,
+        "dim_rdc_name": dim_rdc_name,
+        "reducer": reducer,
+        "reducer_params": reducer_params,
+        "param_dict": param_dict,
+        "ge_n_experiments": spec["ge_n_experiments"],
+    })
+
+
+def landmarks_cover_folds(params, n_profiling):
+    """True if reducer with params selects all training traces of every
+    CV fold as landmarks (same as reducer without landmarks)."""
+    from experiment import CV_FOLDS
+
+    n_landmarks = params.get("n_landmarks")
+    return n_landmarks is not None and n_landmarks >= n_profiling - n_profiling // CV_FOLDS
+
+
+def generate_experiment_tasks(spec, data_handles, dataset_sizes):
+    """All experiments of spec (dataset x target byte x leakage model x
+    reductor), data of dataset is passed as handle of its shared memory.
+    Reductors are described by name and parameters and created only when
+    experiment is run. Landmark reducers whose landmarks would be all
+    training traces are skipped."""
+    for dataset in spec["datasets"]:
+        for target_byte in spec["target_bytes"]:
+            for leakage_model in spec["leakage_models"]:
+                n_classes = get_aes_output_for_leakage(leakage_model).n_classes
+                for dim_rdc_name, reducer, params, param_dict in reducer_configurations(
+                        spec, n_classes):
+                    if landmarks_cover_folds(params, dataset_sizes[dataset][0]):
+                        print("Skipping", dataset, dim_rdc_name,
+                              "(landmarks are all traces of training folds)")
+                        continue
+
+                    key = experiment_key(
+                        spec, dataset, target_byte, leakage_model, dim_rdc_name,
+                        reducer, params, param_dict, dataset_sizes[dataset]
+                    )
+                    yield ExperimentTask(
+                        key, dataset, target_byte, leakage_model, dim_rdc_name,
+                        reducer, params, param_dict,
+                        configuration_n_neighbors(params, param_dict),
+                        spec["ge_n_experiments"], data_handles[dataset]
+                    )
+
+
+def empty_result(fail_msg=None):
+    return {"ge": None, "sr": None, "best_params": None, "cv_results": None,
+            "fail_msg": fail_msg, "timings": {}, "profile": []}
+
+
+def crashed_task_result(task, message):
+    """Result of experiment whose worker process died."""
+    print("Experiment failed:", message)
+    return empty_result(message)
+
+
+def run_task(task):
+    """Runs experiment in worker process, returns only results that are
+    reported (fitted models are not sent back)."""
+    # pipeline and reductors are imported only when experiments are run
+    from experiment import run_experiment
+
+    print("Running experiment:", end=" ")
+    print(task.dataset, task.leakage_model.name, task.dim_rdc_name, sep=" - ")
+
+    data = select_traget_bype(attach_arrays(task.data), task.target_byte)
+
+    # aes_output_fn is used to generate output of produced by aes sbox operation
+    # if traces is X, aes_output_fn(plain, key) can be seen as y
+    aes_output_fn = get_aes_output_for_leakage(task.leakage_model)
+
+    profiler = Profiler(trace_allocations=PROFILE_ALLOCATIONS) if PROFILE else None
+
+    # try to run experimnt
+    result = empty_result()
+
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        dim_rdc = make_reducer(task.reducer, task.reducer_params, task.max_n_neighbors)
+        ge, sr, gridSearch_res = run_experiment(
+            data, aes_output_fn,
+            dim_rdc, task.param_dict,
+            task.ge_n_experiments,
+            profiler=profiler
         )
-
-        param_dict = mf_parameters_dict["n_components"][n_components]
-        for dim_rdc, dim_rdc_name in manifold_dim_rds:
-            yield (dim_rdc,  f"{dim_rdc_name}_{n_components}", param_dict)
+        result["ge"], result["sr"] = ge, sr
+        if gridSearch_res is not None:
+            result["best_params"] = gridSearch_res.best_params_
+            result["cv_results"] = gridSearch_res.cv_results_
+    except Exception as e:
+        print("Experiment failed:", e)
+        result["fail_msg"] = str(e)
+    finally:
+        # graphs of CV folds are shared by grid points of this experiment
+        # only (they are too large to be kept for other experiments)
+        clear_shared_neighbors_graph()
+
+    result["timings"] = {
+        "wall": time.perf_counter() - start_wall,
+        "cpu": time.process_time() - start_cpu,
+    }
+    result["profile"] = profiler.summary() if profiler is not None else []
+
+    return result
+
+
+def task_memory_bytes(task, n_profiling):
+    """Upper bound of memory of worker that runs task: stage cache and
+    neighbors graphs of all CV folds and refit (each for all profiling
+    traces)."""
+    from experiment import CV_FOLDS, STAGE_CACHE_BYTES
+
+    graphs_bytes = 0
+    if task.max_n_neighbors is not None:
+        graphs_bytes = (CV_FOLDS + 1) * neighbors_index_bytes(n_profiling, task.max_n_neighbors)
+
+    return WORKER_BASE_BYTES + STAGE_CACHE_BYTES + graphs_bytes
+
+
+def number_of_workers(tasks, dataset_sizes):
+    """N_WORKERS, or number of workers that fit into memory if it is
+    "auto"."""
+    if N_WORKERS != "auto":
+        return N_WORKERS
+
+    worker_bytes = max(
+        (task_memory_bytes(task, dataset_sizes[task.dataset][0]) for task in tasks), default=0)
+    memory_bytes = available_memory()
+    return workers_for_memory(
+        worker_bytes, memory_bytes and MEMORY_FRACTION * memory_bytes)
+
+
+def write_log(folderName, task, dataset_size, fail_msg=None):
+    now = datetime.now()
+    timestamp = now.strftime("%d_%m_%Y_%H_%M_%S")
+    trainSize, testSize = dataset_size
+    logName = "log.txt"
+    logFile = open("results/"+folderName+"/"+logName, "a+")
+    logFile.write("********* " + timestamp + "\n")
+    logFile.write("Running experiment: " + task.dataset + " - " + task.leakage_model.name + " - " + task.dim_rdc_name  )
+    logFile.write("\n")
+    logFile.write("Dataset size: train - " + str(trainSize) + ", test - " + str(testSize))
+    logFile.write("\n")
+    if fail_msg:
+        logFile.write("!!!Experiment failed: " + fail_msg)
+        logFile.write("\n")
+    logFile.write("\n\n")
+    logFile.close()
+
+
+def write_result(directory, task, result):
+    # report to file, file is written at once so interrupted run never
+    # leaves partial results
+    fileName = task.dataset + "_" + task.leakage_model.name + "_" + task.dim_rdc_name + ".txt"
+    res = []
+
+    ge, sr = result["ge"], result["sr"]
+    if result["fail_msg"]:
+        res.append("!!!Experiment failed: " + result["fail_msg"])
+    else:
+        if result["best_params"] is not None:
+            res.append("Grid Search params:")
+            res.append("\n")
+            res.append("best_params_: %s;" % result["best_params"])
+            res.append("cv_results_: %s;" % result["cv_results"])
+            res.append("\n")
+        else:
+            res.append("No Grid Search.\n")
+        if ge.size > 0:
+            res.append("ge:")
+            res.append("\n")
+            for item in ge:
+                res.append("%s;" % item)
+            res.append("\n")
+        if sr.size > 0:
+            res.append("sr:")
+            res.append("\n")
+            for item in sr:
+                res.append("%s;" % item)
+            res.append("\n")
+
+    write_atomic(os.path.join(directory, fileName), "".join(res))
+
+
+def store_result(store, task, result, load_profile):
+    # typed arrays and metadata of experiment (see resParser)
+    method, n_components = task.dim_rdc_name.rsplit("_", 1)
+
+    arrays = {}
+    best_params = None
+    if not result["fail_msg"]:
+        arrays["ge"] = result["ge"]
+        arrays["sr"] = result["sr"]
+        if result["cv_results"] is not None:
+            arrays.update(cv_results_arrays(result["cv_results"]))
+            best_params = {
+                name.split("__")[-1]: value for name, value in result["best_params"].items()
+            }
+
+    store.append(
+        task.key, arrays,
+        dataset=task.dataset,
+        target_byte=task.target_byte,
+        leakage_model=task.leakage_model.name,
+        dim_rdc_name=task.dim_rdc_name,
+        method=method,
+        n_components=int(n_components),
+        best_params=best_params,
+        timings=result["timings"],
+        profile=load_profile + result["profile"],
+        fail_msg=result["fail_msg"],
+    )
 
 
-################################### main ######################################
-# create output dir
-now = datetime.now()
-timestamp = now.strftime("%d_%m_%Y_%H_%M_%S")
-folderName = "run_" + timestamp
-directory = folderName
-parent_dir = "results/"
-path = os.path.join(parent_dir, directory)
-os.makedirs(path)
-
-
-
-
-for dataset in datasets:
-    data = load_data(DATA_ROOT/dataset, TARGET_BYTE)
-
-    for leakage_model in leakage_models:
-        # aes_output_fn is used to generate output of produced by aes sbox operation
-        # if traces is X, aes_output_fn(plain, key) can be seen as y
-        aes_output_fn = get_aes_output_for_leakage(leakage_model)
-
-        for dim_rdc, dim_rdc_name, param_dict in generate_all_dim_reductors():
-
-            print("Running experiment:", end=" ")
-            print(dataset, leakage_model.name, dim_rdc_name, sep=" - ")
-            
-            now = datetime.now()
-            timestamp = now.strftime("%d_%m_%Y_%H_%M_%S")
-            trainSize= data[0]
-            testSize = data[1]
-            logName = "log.txt"
-            logFile = open("results/"+folderName+"/"+logName, "a+")
-            logFile.write("********* " + timestamp + "\n")
-            logFile.write("Running experiment: " + dataset + " - " + leakage_model.name + " - " + dim_rdc_name  )
-            logFile.write("\n")
-            logFile.write("Dataset size: train - " + str(len(trainSize[1])) + ", test - " + str(len(testSize[1])))
-            logFile.write("\n")
-
-            if PREVIEW:
-                continue
-
-            # try to run experimnt
-            ge = sr = gridSearch_res = fail_msg = None
-            
-            try:
-                ge, sr, gridSearch_res = run_experiment(
-                    data, aes_output_fn,
-                    dim_rdc, param_dict,
-                    GE_N_EXPERIMENTS
-                )
-            except Exception as e:
-                 print("Experiment failed:", e)
-                 fail_msg = str(e)
-
-            # report to file
-            # create file
-            fileName = dataset + "_" + leakage_model.name + "_" + dim_rdc_name + ".txt"
-            resFile = open("results/"+folderName+"/"+fileName, "w+")
-            
-            # write to file
-            if fail_msg:
-                resFile.write("!!!Experiment failed: " + fail_msg)
-                logFile.write("!!!Experiment failed: " + fail_msg)
-                logFile.write("\n")
-            else:
-                if gridSearch_res != None:
-                    resFile.write("Grid Search params:")
-                    resFile.write("\n")
-                    resFile.write("best_params_: %s;" % gridSearch_res.best_params_)  
-                    resFile.write("cv_results_: %s;" % gridSearch_res.cv_results_) 
-                    resFile.write("\n")
-                if gridSearch_res == None:
-                    resFile.write("No Grid Search.\n")
-                if ge.size > 0:
-                    resFile.write("ge:")
-                    resFile.write("\n")
-                    for item in ge:
-                        resFile.write("%s;" % item)
-                    resFile.write("\n")
-                if sr.size > 0:
-                    resFile.write("sr:")
-                    resFile.write("\n")
-                    for item in sr:
-                        resFile.write("%s;" % item)
-                    resFile.write("\n")
-
-            resFile.close()
-            logFile.write("\n\n")
-            logFile.close()
+def result_directory(path, spec, task):
+    # results of other target bytes would overwrite each other
+    if len(spec["target_bytes"]) == 1:
+        return path
+    directory = os.path.join(path, f"byte_{task.target_byte}")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def main(spec_file=SPEC_FILE):
+    spec = load_spec(spec_file)
+
+    # create output dir (or reuse directory of resumed run)
+    if RESUME_RUN is None:
+        now = datetime.now()
+        timestamp = now.strftime("%d_%m_%Y_%H_%M_%S")
+        folderName = "run_" + timestamp
+    else:
+        folderName = RESUME_RUN
+    directory = folderName
+    parent_dir = "results/"
+    path = os.path.join(parent_dir, directory)
+    os.makedirs(path, exist_ok=RESUME_RUN is not None)
+
+    # status of every experiment, finished experiments are not run again
+    # when run is resumed (experiments that were running are restarted)
+    manifest = RunManifest(os.path.join(path, "manifest.jsonl"))
+    store = ResultsStore(os.path.join(path, "store"))
+
+    # datasets are loaded once and shared with all workers
+    shared_data = {}
+    dataset_sizes = {}
+    load_profiles = {}
+    try:
+        for dataset in spec["datasets"]:
+            # all bytes of plaintext and key, target byte is selected by
+            # experiment
+            profiler = Profiler(trace_allocations=PROFILE_ALLOCATIONS) if PROFILE else None
+            data = load_data(Path(spec["data_root"])/dataset, None,
+                             cache_dir=spec["data_cache_dir"], profiler=profiler,
+                             **spec["data_slices"])
+            load_profiles[dataset] = profiler.summary() if profiler is not None else []
+            shared_data[dataset] = SharedArrays(data)
+            dataset_sizes[dataset] = (len(data[0][1]), len(data[1][1]))
+            del data
+
+        tasks = [
+            task for task in generate_experiment_tasks(
+                spec, {dataset: shared.handle for dataset, shared in shared_data.items()},
+                dataset_sizes)
+            if not manifest.is_finished(task.key)
+        ]
+
+        if PREVIEW:
+            for task in tasks:
+                write_log(folderName, task, dataset_sizes[task.dataset])
+            return
+
+        # implementations of reductors (and pipeline) are imported once,
+        # before worker processes are forked
+        preload({task.reducer for task in tasks})
+        import experiment  # noqa: F401
+
+        def mark_running(task):
+            manifest.mark(task.key, RunManifest.RUNNING,
+                          dataset=task.dataset, leakage_model=task.leakage_model.name,
+                          dim_rdc_name=task.dim_rdc_name)
+
+        n_workers = number_of_workers(tasks, dataset_sizes)
+        print("Workers:", n_workers)
+
+        # results are reported as experiments finish
+        for task, result in run_tasks(run_task, tasks, n_workers, N_THREADS,
+                                      on_start=mark_running,
+                                      crash_result=crashed_task_result):
+            write_log(folderName, task, dataset_sizes[task.dataset], result["fail_msg"])
+            write_result(result_directory(path, spec, task), task, result)
+            store_result(store, task, result, load_profiles[task.dataset])
+
+            status = RunManifest.FAILED if result["fail_msg"] else RunManifest.DONE
+            manifest.mark(task.key, status,
+                          dataset=task.dataset, leakage_model=task.leakage_model.name,
+                          dim_rdc_name=task.dim_rdc_name)
+    finally:
+        for shared in shared_data.values():
+            shared.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else SPEC_FILE)
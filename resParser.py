@@ -3,23 +3,48 @@
 Created on Thu Mar 25 12:50:34 2021
 
 @author: Nikolina
+
+Usage: python resParser.py <results root folder> [number of plotting processes] [--import]
+
+Results of every run folder are read from its results store, runs without
+store are read from their text result files (with --import their results
+store is created, so later runs read only the store). Plots are saved to
+root folder, one for every dataset - leakage model - number of components.
 """
 import sys
 import os
+from multiprocessing import Pool
 from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+import numpy as np
+
+from utils.aes import LeakageModel
+from utils.results_store import ResultsStore
+
+STORE_DIR = "store"
+
 
 class Result:
     def __init__(self, name):
         self.name = name
-        split_string = name.split(".")
-        split_string = split_string[0].split("_")
-        self.datasetName = split_string[0]+"_"+split_string[1]
-        self.leakageModel = split_string[2]
-        self.method = split_string[3]
-        self.componentNo = split_string[4]
+        # <dataset>_<leakage model>_<method>_<components>.txt, all names
+        # except components can contain "_", so leakage model is found by
+        # its name (longest first, e.g. last_round_HW before HW)
+        stem = name.split(".")[0]
+        for leakageModel in sorted(LeakageModel.__members__, key=len, reverse=True):
+            dataset, found, rest = stem.partition("_" + leakageModel + "_")
+            if found:
+                break
+        else:
+            raise ValueError("Unknown leakage model in result file: " + name)
+        self.datasetName = dataset
+        self.leakageModel = leakageModel
+        self.method, self.componentNo = rest.rsplit("_", 1)
         self.best_params = None
-        
+
     def parseResult(self, content):
         if content.startswith("No Grid Search."):
             pass
@@ -36,79 +61,130 @@ class Result:
         self.srData=sr_res.split(";")
         self.srData.pop()
         self.srData = list(map(float, self.srData))
-        
-
-results = []
-rootFolderName = sys.argv[1]
-subFolders = os.listdir(rootFolderName + '/')
-for subFolder in subFolders:
-    if os.path.isdir(rootFolderName + '/' + subFolder):  
-        entries = os.listdir(rootFolderName + '/' + subFolder)
-        for entry in entries:
-            if ("log" not in entry) and ("output" not in entry):
-                file = open(rootFolderName + '/' + subFolder + '/' + entry)
-                line = file.read().replace("\n", " ")
-                file.close()
-                if line.startswith("!!!"):
-                    continue
-                else:
-                    res = Result(entry)
-                    res.parseResult(line)
-                    results.append(res)
-
-
-datasets = [
-    #"chipwhisperer",
-    "ascad_fixed",
-    "ascad_variable",
-    "ches_ctf"
-]
-
-leakage_models = [
-    "intermediate",
-    "HW"
-]
-
-comp_num = [
-    "10", "25", "50", "75", "100"
-]
-
-
-for ds in datasets:
-    for lm in leakage_models:
-        for cn in comp_num:            
-            print(ds +"-" + lm +"-" + cn)
-            print("Best neighbour vals:")
-            plt.figure()
-            
-            for result in results:
-                if result.datasetName==ds and result.leakageModel== lm and result.componentNo==cn:
-                    #best values
-                    if result.best_params != None:
-                        print(result.method + ": " + str(result.best_params)) 
-                    #GE                    
-                    plt.plot(result.geData, label=result.method)
-
-            
-            plt.title(ds +"-" + lm +"-" + cn)  
-            plt.ylabel("GE vals")
-            plt.legend(bbox_to_anchor=(1.05, 1.0), loc='upper left')
-            plt.savefig(rootFolderName + "/" + ds +"-" + lm +"-" + cn + ".png", bbox_inches = "tight")
-            plt.show()
-            
-            
-            # #SR
-            # plt.figure()
-            # for result in results:
-            #     if result.datasetName=="ascad_fixed" and result.leakageModel== "intermediate" and result.componentNo=="10":
-            #         plt.plot(result.srData, label=result.method)
-                 
-            # plt.title(result.datasetName +"-"+ result.leakageModel +"-"+ result.componentNo)           
-            # plt.ylabel("SR vals")
-            # plt.legend()
-            # plt.show()
-
-            print("*********************************")
-            print("*********************************")
-                
-    
\ No newline at end of file
+
+
+def read_text_results(run_folder):
+    """Results of text result files of run folder (runs from before
+    results store) as entries with the same metadata as entries of
+    results store, GE and SR are included in entries."""
+    results = []
+    for entry in sorted(os.listdir(run_folder)):
+        if ("log" in entry) or ("output" in entry) or not entry.endswith(".txt"):
+            continue
+        file = open(run_folder/entry)
+        line = file.read().replace("\n", " ")
+        file.close()
+        if line.startswith("!!!"):
+            continue
+
+        res = Result(entry)
+        res.parseResult(line)
+        results.append({
+            "key": res.name,
+            "dataset": res.datasetName,
+            "leakage_model": res.leakageModel,
+            "dim_rdc_name": res.method + "_" + res.componentNo,
+            "method": res.method,
+            "n_components": int(res.componentNo),
+            "best_params": None if res.best_params is None else {"n_neighbors": res.best_params},
+            "fail_msg": None,
+            "ge": np.array(res.geData),
+            "sr": np.array(res.srData),
+        })
+    return results
+
+
+def import_text_results(run_folder):
+    """Results store of run folder created from its text result files."""
+    store = ResultsStore(run_folder/STORE_DIR)
+    for result in read_text_results(run_folder):
+        metadata = dict(result)
+        key = metadata.pop("key")
+        arrays = {"ge": metadata.pop("ge"), "sr": metadata.pop("sr")}
+        store.append(key, arrays, **metadata)
+    return store
+
+
+def successful_results(rootFolder, import_text=False):
+    """(store directory, entry) of all successful experiments of runs in
+    rootFolder. Results of runs without store are read from text result
+    files into memory (store directory is None), unless import_text is
+    True, then their store is created."""
+    for subFolder in sorted(os.listdir(rootFolder)):
+        run_folder = rootFolder/subFolder
+        if not run_folder.is_dir():
+            continue
+
+        if (run_folder/STORE_DIR/ResultsStore.INDEX_FILE).exists():
+            store = ResultsStore(run_folder/STORE_DIR)
+        elif import_text:
+            store = import_text_results(run_folder)
+        else:
+            for result in read_text_results(run_folder):
+                yield None, result
+            continue
+
+        for entry in store.query(fail_msg=None):
+            if "shard" in entry:
+                yield store.directory, entry
+
+
+def plot_group(args):
+    # runs in worker process, reads only GE arrays of its group
+    rootFolder, title, entries = args
+
+    plt.figure()
+    for store_dir, entry in entries:
+        if store_dir is None:
+            ge = entry["ge"]
+        else:
+            ge = ResultsStore(store_dir).load(entry, ["ge"])["ge"]
+        plt.plot(ge, label=entry["method"])
+
+    plt.title(title)
+    plt.ylabel("GE vals")
+    plt.legend(bbox_to_anchor=(1.05, 1.0), loc='upper left')
+    plt.savefig(rootFolder/(title + ".png"), bbox_inches = "tight")
+    plt.close()
+    return title
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != "--import"]
+    import_text = "--import" in sys.argv[1:]
+    rootFolder = Path(args[0])
+    n_jobs = int(args[1]) if len(args) > 1 else None
+
+    # dataset - leakage model - number of components (- target byte)
+    # groups of all successful experiments, found from index only
+    groups = {}
+    for store_dir, entry in successful_results(rootFolder, import_text):
+        group = (entry["dataset"], entry["leakage_model"], entry["n_components"],
+                 entry.get("target_byte", 0))
+        groups.setdefault(group, []).append((store_dir, entry))
+
+    jobs = []
+    for (ds, lm, cn, byte), entries in sorted(groups.items()):
+        title = ds + "-" + lm + "-" + str(cn)
+        if byte:
+            title += "-byte" + str(byte)
+        print(title)
+        print("Best neighbour vals:")
+        for _, entry in entries:
+            #best values
+            if entry["best_params"]:
+                print(entry["method"] + ": " + ", ".join(
+                    str(value) for value in entry["best_params"].values()))
+        print("*********************************")
+        print("*********************************")
+
+        jobs.append((rootFolder, title, entries))
+
+    # GE plots
+    with Pool(n_jobs) as pool:
+        for title in pool.imap_unordered(plot_group, jobs):
+            print("Saved plot:", title + ".png")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from sklearn.model_selection import KFold
+
+from utils.class_statistics import ClassStatistics, FoldStatistics
+
+
+def _traces(n_traces=300, n_features=6, n_classes=9, seed=0):
+    rng = np.random.default_rng(seed)
+    traces = rng.integers(-128, 128, (n_traces, n_features)).astype(np.int8)
+    y = rng.integers(0, n_classes, n_traces)
+    return traces, y
+
+
+@pytest.mark.parametrize("full_scatter", [True, False])
+def test_update_matches_per_class_reference(full_scatter):
+    traces, y = _traces()
+    statistics = ClassStatistics(full_scatter).update(traces, y)
+
+    np.testing.assert_array_equal(statistics.classes, np.unique(y))
+    for i, c in enumerate(statistics.classes):
+        traces_for_class = traces[y == c].astype(np.float64)
+        assert statistics.counts[i] == len(traces_for_class)
+        np.testing.assert_allclose(statistics.means[i], traces_for_class.mean(axis=0))
+        np.testing.assert_allclose(
+            statistics.variances[i], traces_for_class.var(axis=0, ddof=1))
+        np.testing.assert_array_equal(statistics.minimums[i], traces_for_class.min(axis=0))
+        np.testing.assert_array_equal(statistics.maximums[i], traces_for_class.max(axis=0))
+        if full_scatter:
+            np.testing.assert_allclose(
+                statistics.covariances[i], np.cov(traces_for_class, rowvar=False))
+
+
+def test_fold_index_compares_all_training_traces():
+    traces, y = _traces()
+    splits = list(KFold(3).split(traces))
+    folds = FoldStatistics(traces, y, splits, n_probes=4)
+
+    for fold, (train, _) in enumerate(splits):
+        assert folds.fold_index(traces[train], y[train]) == fold
+    assert folds.fold_index(traces) == "all"
+
+    # differs from training traces of fold 0 only between probes
+    train = splits[0][0]
+    changed = traces[train].copy()
+    changed[1] += 1
+    assert folds.fold_index(changed) is None
+    assert folds.lookup(changed) is None
+
+    changed_y = y[train].copy()
+    changed_y[1] += 1
+    assert folds.fold_index(traces[train], changed_y) is None
+
+
+def _assert_same_statistics(statistics, expected):
+    np.testing.assert_array_equal(statistics.classes, expected.classes)
+    np.testing.assert_array_equal(statistics.counts, expected.counts)
+    np.testing.assert_allclose(statistics.means, expected.means)
+    np.testing.assert_allclose(statistics.scatters, expected.scatters, atol=1e-8)
+    np.testing.assert_array_equal(statistics.minimums, expected.minimums)
+    np.testing.assert_array_equal(statistics.maximums, expected.maximums)
+
+
+@pytest.mark.parametrize("full_scatter", [True, False])
+def test_merge_matches_single_pass(full_scatter):
+    traces, y = _traces(n_traces=500)
+    expected = ClassStatistics(full_scatter).update(traces, y)
+
+    # chunks of different sizes, the first one misses some classes
+    order = np.argsort(y, kind="stable")
+    chunks = np.split(order, [40, 170, 300])
+    parts = ClassStatistics.from_partitions(traces, y, chunks, full_scatter)
+    assert len(parts[0].classes) < len(expected.classes)
+
+    merged = ClassStatistics(full_scatter)
+    for part in parts[::-1]:
+        merged.merge(part)
+    _assert_same_statistics(merged, expected)
+
+    _assert_same_statistics(sum(parts[1:], parts[0]), expected)
+
+    updated = ClassStatistics(full_scatter)
+    for chunk in chunks:
+        updated.update(traces[chunk], y[chunk])
+    _assert_same_statistics(updated, expected)
+
+
+def test_fold_statistics_match_training_traces():
+    traces, y = _traces()
+    splits = list(KFold(4).split(traces))
+    folds = FoldStatistics(traces, y, splits, full_scatter=True)
+
+    for fold, (train, _) in enumerate(splits):
+        _assert_same_statistics(
+            folds.lookup(traces[train], y[train]),
+            ClassStatistics().update(traces[train], y[train]))
+    _assert_same_statistics(folds.lookup(traces, y), ClassStatistics().update(traces, y))
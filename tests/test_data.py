@@ -0,0 +1,45 @@
+import json
+
+import numpy as np
+import pytest
+
+from utils.aes import LeakageModel
+from utils.data import (
+    _write_cache_entry, generate_synthetic_data, load_data_cached, load_data_chipwhisperer,
+    write_synthetic_data,
+)
+
+
+@pytest.mark.parametrize("leakage_model", [LeakageModel.HW, LeakageModel.HD, LeakageModel.intermediate])
+@pytest.mark.parametrize("masked", [False, True])
+def test_synthetic_leakage_has_requested_snr(leakage_model, masked):
+    (traces, _, _), _ = generate_synthetic_data(
+        50000, 10, 20, leakage_model=leakage_model, leakage_amplitude=2.0, noise=0.5,
+        masked=masked, dtype=np.float64, random_state=0)
+
+    leakage = traces[:, 10]
+    assert abs(leakage.mean()) < 0.05
+    # variance of leakage (amplitude**2) plus variance of noise
+    assert leakage.var() == pytest.approx(2.0**2 + 0.5**2, rel=0.05)
+
+
+def test_cache_entry_written_concurrently_is_reused(tmp_path):
+    data = generate_synthetic_data(100, 20, 30, random_state=0)
+    path = tmp_path/"chipwhisperer"
+    indexes = write_synthetic_data(path, data)
+    cache_dir = tmp_path/"cache"
+
+    expected = load_data_cached(load_data_chipwhisperer, path, 0, cache_dir, **indexes)
+
+    # other process finishes the same entries while this one writes them
+    trace_sets = load_data_chipwhisperer(path, 0, lazy=True, **indexes)
+    for part, trace_set in zip(("profiling", "attack"), trace_sets):
+        entry_dir, = cache_dir.glob(f"load_data_chipwhisperer_{part}_*")
+        _write_cache_entry(trace_set, entry_dir)
+
+    assert not list(cache_dir.glob(".tmp_*"))
+    loaded = load_data_cached(load_data_chipwhisperer, path, 0, cache_dir, **indexes)
+    for expected_part, part in zip(expected, loaded):
+        for expected_array, array in zip(expected_part, part):
+            np.testing.assert_array_equal(array, expected_array)
+    assert "sha256" in next(iter(json.loads((cache_dir/"source_hashes.json").read_text()).values()))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from utils.key_rank import _log_probas, estimate_rank
+
+
+def exact_rank(scores, key):
+    # number of full keys with higher score than key (two bytes only)
+    log_probas = _log_probas(scores)
+    totals = log_probas[0][:, np.newaxis] + log_probas[1][np.newaxis, :]
+    return np.sum(totals > totals[key[0], key[1]])
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("n_bins", [64, 2048])
+def test_estimate_is_within_bounds_around_exact_rank(seed, n_bins):
+    rng = np.random.default_rng(seed)
+    scores = rng.normal(size=(2, 256)) * 3
+    key = rng.integers(0, 256, 2)
+
+    lower, estimate, upper = estimate_rank(scores, key, n_bins)
+    rank = exact_rank(scores, key)
+
+    assert lower <= rank <= upper
+    assert lower <= estimate <= upper
+    assert 0 <= lower and upper < 256**2
+
+
+def test_best_and_worst_keys():
+    scores = np.tile(np.arange(256, dtype=np.float64), (3, 1))
+
+    lower, estimate, upper = estimate_rank(scores, np.full(3, 255))
+    assert lower == estimate == 0
+    assert upper < 256**3
+
+    lower, estimate, upper = estimate_rank(scores, np.zeros(3, dtype=int))
+    assert upper == 256**3 - 1
+    assert lower <= estimate <= upper
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from utils.measure import _experiment_streams, guessing_entropy_and_success_rate
+
+
+def reference_ge_sr(y_log_proba, secret_key, number_of_experiments, random_state):
+    # argsort ranking of baseline implementation, with the same trace
+    # orders as guessing_entropy_and_success_rate
+    N, L = y_log_proba.shape
+    GE, SR = np.zeros(N), np.zeros(N)
+    for stream in _experiment_streams(random_state, number_of_experiments):
+        permutation = np.random.default_rng(stream).permutation(N)
+        cumsum = y_log_proba[permutation].cumsum(axis=0)
+        ranked_key_guesses = cumsum.argsort(axis=1)
+        key_rank = L - np.argmax(ranked_key_guesses == secret_key, axis=1) - 1
+        GE += key_rank
+        SR += key_rank == 0
+    return GE / number_of_experiments, SR / number_of_experiments
+
+
+def test_matches_argsort_reference():
+    rng = np.random.default_rng(0)
+    scores = np.log(rng.dirichlet(np.ones(256), 40))
+    scores[:, 3] += 0.05
+
+    ge, sr = guessing_entropy_and_success_rate(scores, 3, 20, random_state=1)
+    reference_ge, reference_sr = reference_ge_sr(scores, 3, 20, random_state=1)
+
+    np.testing.assert_array_equal(ge, reference_ge)
+    np.testing.assert_array_equal(sr, reference_sr)
+
+
+def test_scores_are_not_modified():
+    scores = np.log(np.random.default_rng(0).dirichlet(np.ones(256), 10))
+    copy = scores.copy()
+    guessing_entropy_and_success_rate(scores, 0, 5, random_state=0)
+    np.testing.assert_array_equal(scores, copy)
+
+
+def test_all_tied_scores_rank_key_last():
+    scores = np.zeros((10, 256))
+    ge, sr = guessing_entropy_and_success_rate(scores, 5, 5, random_state=0)
+    np.testing.assert_array_equal(ge, 255)
+    np.testing.assert_array_equal(sr, 0)
+
+
+def test_tied_groups_count_as_better():
+    # like LSB model: half of guesses share score of key in every trace
+    scores = np.where(np.arange(256) % 2 == 0, np.log(0.6), np.log(0.4))
+    scores = np.tile(scores, (8, 1))
+    ge, sr = guessing_entropy_and_success_rate(scores, 0, 5, random_state=0)
+    np.testing.assert_array_equal(ge, 127)
+    np.testing.assert_array_equal(sr, 0)
+
+
+@pytest.mark.parametrize("batch_size, n_jobs", [(1, None), (3, 2), (None, None)])
+def test_independent_of_batches_and_jobs(batch_size, n_jobs):
+    scores = np.log(np.random.default_rng(0).dirichlet(np.ones(256), 30))
+    expected = guessing_entropy_and_success_rate(scores, 0, 10, random_state=7)
+    result = guessing_entropy_and_success_rate(
+        scores, 0, 10, batch_size=batch_size, random_state=7, n_jobs=n_jobs)
+    np.testing.assert_array_equal(result[0], expected[0])
+    np.testing.assert_array_equal(result[1], expected[1])
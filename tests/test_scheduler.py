@@ -0,0 +1,33 @@
+import os
+
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.scheduler import run_tasks
+
+
+def crash_on_three(task):
+    if task == 3:
+        os._exit(9)
+    return task * 10
+
+
+def test_crashed_worker_fails_only_its_task():
+    started = []
+    results = dict(run_tasks(crash_on_three, range(6), n_workers=2, on_start=started.append,
+                             crash_result=lambda task, message: "crashed"))
+
+    assert results == {0: 0, 1: 10, 2: 20, 3: "crashed", 4: 40, 5: 50}
+    assert set(started) == set(range(6))
+
+
+def test_crash_without_crash_result_raises():
+    with pytest.raises(BrokenProcessPool):
+        list(run_tasks(crash_on_three, [3], n_workers=2))
+
+
+def test_tasks_run_in_process_without_workers():
+    started = []
+    results = list(run_tasks(crash_on_three, [1, 2], on_start=started.append))
+    assert results == [(1, 10), (2, 20)]
+    assert started == [1, 2]
@@ -0,0 +1,81 @@
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from utils.stage_cache import CachedTransformer, StageCache
+
+
+def _array(n_bytes, value=0):
+    return np.full(n_bytes // 8, value, dtype=np.float64)
+
+
+def test_hits_and_misses_are_counted():
+    cache = StageCache(max_bytes=1000)
+    assert cache.get("a") is None
+    cache.put("a", _array(80, 1))
+
+    np.testing.assert_array_equal(cache.get("a"), _array(80, 1))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = StageCache(max_bytes=250)
+    cache.put("a", _array(100))
+    cache.put("b", _array(100))
+    cache.get("a")
+    cache.put("c", _array(100))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_entry_larger_than_cache_is_kept_until_next_put():
+    cache = StageCache(max_bytes=10)
+    cache.put("a", _array(100))
+    assert cache.get("a") is not None
+
+    cache.put("b", _array(100))
+    assert cache.get("a") is None
+
+
+def test_evicted_arrays_are_moved_to_disk(tmp_path):
+    cache = StageCache(max_bytes=150, directory=tmp_path, max_disk_bytes=250)
+    for i, key in enumerate("abcd"):
+        cache.put(key, _array(100, i))
+
+    # a, b and c were evicted from memory, all three exceed disk limit,
+    # so a was dropped from disk
+    assert len(list(tmp_path.glob("*.pkl"))) == 2
+    assert cache.get("a") is None
+    np.testing.assert_array_equal(cache.get("b"), _array(100, 1))
+
+    # entry read from disk is moved back to memory
+    assert not (tmp_path/"b.pkl").exists()
+    assert cache.hits == 1
+
+
+class _CountingScaler(TransformerMixin, BaseEstimator):
+    n_fits = 0
+
+    def __init__(self, factor=2.0):
+        self.factor = factor
+
+    def fit(self, X, y=None):
+        type(self).n_fits += 1
+        return self
+
+    def transform(self, X):
+        return X * self.factor
+
+
+def test_cached_transformer_fits_once_per_data_and_params():
+    cache = StageCache()
+    X = np.arange(12.0).reshape(4, 3)
+
+    first = CachedTransformer(_CountingScaler(), cache).fit_transform(X)
+    second = CachedTransformer(_CountingScaler(), cache).fit_transform(X)
+    other = CachedTransformer(_CountingScaler(factor=3.0), cache).fit_transform(X)
+
+    assert _CountingScaler.n_fits == 2
+    np.testing.assert_array_equal(first, second)
+    np.testing.assert_array_equal(other, X * 3)
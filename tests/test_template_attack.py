@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from utils.aes import LeakageModel, get_aes_output_for_leakage
+from utils.discriminant import FisherDiscriminantReducer
+from utils.sklearn_wrappers import TraceData
+from utils.TA import TemplateAttack
+
+
+def _data(n_traces=2000, n_features=5, key=0x2b, seed=0):
+    output_fn = get_aes_output_for_leakage(LeakageModel.HW)
+    rng = np.random.default_rng(seed)
+    plain = rng.integers(0, 256, n_traces, dtype=np.uint8)
+    keys = np.full(n_traces, key, dtype=np.uint8)
+    output = output_fn(plain, keys)
+    traces = rng.standard_normal((n_traces, n_features)) + output[:, np.newaxis] * np.arange(n_features)
+    return output_fn, TraceData(traces, plain), keys, output
+
+
+@pytest.mark.parametrize("covariance", ["pooled", "per_class"])
+def test_template_attack_partial_fit_matches_fit(covariance):
+    output_fn, X, keys, _ = _data()
+    expected = TemplateAttack(output_fn, covariance=covariance).fit(X, keys)
+
+    ta = TemplateAttack(output_fn, covariance=covariance)
+    for chunk in np.array_split(np.arange(len(X)), 5):
+        ta.partial_fit(X[chunk], keys[chunk])
+
+    np.testing.assert_allclose(ta.predict_proba(X), expected.predict_proba(X))
+    assert ta.predict(X) == expected.predict(X) == 0x2b
+
+
+@pytest.mark.parametrize("solver", ["eigen", "class_means"])
+def test_fisher_discriminant_partial_fit_matches_fit(solver):
+    _, X, _, output = _data()
+    expected = FisherDiscriminantReducer(n_components=3, solver=solver).fit(X.traces, output)
+    batched = FisherDiscriminantReducer(
+        n_components=3, solver=solver, batch_size=300).fit(X.traces, output)
+
+    reducer = FisherDiscriminantReducer(n_components=3, solver=solver)
+    for chunk in np.array_split(np.arange(len(X)), 7):
+        reducer.partial_fit(X.traces[chunk], output[chunk])
+
+    for result in (batched, reducer):
+        np.testing.assert_allclose(result.within_scatter_, expected.within_scatter_)
+        # directions are unique up to sign
+        signs = np.sign(np.sum(result.components_ * expected.components_, axis=1))
+        np.testing.assert_allclose(
+            result.components_ * signs[:, np.newaxis], expected.components_, atol=1e-8)
@@ -1,68 +1,193 @@
 import numpy as np
-from scipy.stats import multivariate_normal
+from scipy.linalg import solve_triangular
 from sklearn.base import ClassifierMixin, BaseEstimator
 
+from utils.aes import LeakageTable
+from utils.class_statistics import ClassStatistics
+from utils.sklearn_wrappers import TraceData
+
+
+def _split_traces_plain(X):
+    # X is TraceData or (traces | plain_text) matrix
+    if isinstance(X, TraceData):
+        return X.traces, X.plaintext.astype(np.uint8)
+    return X[:, :-1], X[:, -1].astype(np.uint8)
+
+
+def _pooled_covariance(class_covs, counts, shrinkage):
+    return np.average(class_covs, axis=0)[np.newaxis]
+
+
+def _per_class_covariance(class_covs, counts, shrinkage):
+    return class_covs
+
+
+def _oas_shrinkage(class_covs, counts):
+    # oracle approximating shrinkage intensity (Chen et al.), it needs only
+    # covariance matrix and number of traces of every class
+    n_features = class_covs.shape[-1]
+
+    mu = np.trace(class_covs, axis1=1, axis2=2) / n_features
+    alpha = np.mean(class_covs**2, axis=(1, 2))
+
+    num = alpha + mu**2
+    den = (counts + 1) * (alpha - mu**2 / n_features)
+
+    shrinkage = np.ones_like(num)
+    np.divide(num, den, out=shrinkage, where=den > 0)
+
+    return np.minimum(shrinkage, 1)
+
+
+def _shrunk_covariance(class_covs, counts, shrinkage):
+    # per class covariance shrunk toward scaled identity
+    if shrinkage is None:
+        shrinkage = _oas_shrinkage(class_covs, counts)
+    shrinkage = np.broadcast_to(shrinkage, counts.shape)[:, np.newaxis, np.newaxis]
+
+    n_features = class_covs.shape[-1]
+    mu = np.trace(class_covs, axis1=1, axis2=2) / n_features
+    target = mu[:, np.newaxis, np.newaxis] * np.eye(n_features)
+
+    return (1 - shrinkage) * class_covs + shrinkage * target
+
+
+def _diagonal_covariance(class_covs, counts, shrinkage):
+    # per class covariance shrunk toward its diagonal
+    if shrinkage is None:
+        shrinkage = 1
+
+    n_features = class_covs.shape[-1]
+    target = class_covs * np.eye(n_features)
+
+    return (1 - shrinkage) * class_covs + shrinkage * target
+
+
+covariance_estimators = {
+    "pooled": _pooled_covariance,
+    "per_class": _per_class_covariance,
+    "shrunk": _shrunk_covariance,
+    "diagonal": _diagonal_covariance,
+}
+
 
 class TemplateAttack(BaseEstimator, ClassifierMixin):
+    """Template attack with gaussian templates for every output class.
+
+    Args:
+        output_fn: function mapping (plain_text, key) to output class
+        covariance (str): template covariance mode, one of
+            "pooled"    - one covariance matrix shared by all classes
+            "per_class" - separate covariance matrix for every class
+            "shrunk"    - per class covariance shrunk toward scaled identity
+            "diagonal"  - per class covariance shrunk toward its diagonal
+        shrinkage (float): shrinkage intensity in [0, 1] for "shrunk" and
+            "diagonal" modes. If None it is estimated for "shrunk" mode
+            (OAS) and only diagonal is used for "diagonal" mode.
+    """
 
-    def __init__(self, output_fn):
+    def __init__(self, output_fn, covariance="pooled", shrinkage=None):
         self.output_fn = output_fn
-        self.distributions = None
+        self.covariance = covariance
+        self.shrinkage = shrinkage
+        self.statistics = None
+        self.classes = None
+        self.means = None
+        self._cov_cholesky = None
+        self._log_dets = None
+        self._class_index_table = None
         self._logpdfs = None
-        self.subkeys = range(256)
+        self.subkeys = np.arange(256)
 
-    def _create_template_distrubutions(self, traces, y):
-        output_classes = np.unique(y)
+    def _create_template_distrubutions(self, statistics):
+        if self.covariance not in covariance_estimators:
+            raise ValueError(
+                f"Unknown covariance mode '{self.covariance}', "
+                f"supported are {list(covariance_estimators.keys())}")
 
-        # calculate means and covariances for every output class
-        meanVectors = {}
-        covMatrices = {}
-        for output_class in output_classes:
+        # template covariances (one matrix if it is shared by all classes)
+        covariance_estimator = covariance_estimators[self.covariance]
+        covs = covariance_estimator(
+            statistics.covariances, statistics.counts, self.shrinkage)
 
-            traces_for_class = traces[y == output_class]
+        # factorize all covariances at once and store their log determinants
+        cov_cholesky = np.linalg.cholesky(covs)
+        log_dets = 2 * np.sum(
+            np.log(np.diagonal(cov_cholesky, axis1=1, axis2=2)), axis=1)
 
-            # mean for selected features
-            mean = np.average(traces_for_class, axis=0)
-            meanVectors[output_class] = mean
+        return statistics.classes, statistics.means, cov_cholesky, log_dets
 
-            # cov for selected features
-            # print(traces_for_class)
-            cov = np.cov(traces_for_class, rowvar=False)
-            covMatrices[output_class] = cov
+    def _class_logpdfs(self, traces):
+        n_features = self.means.shape[1]
 
-        # pooled cov matrix
-        pooledCov = np.average(list(covMatrices.values()), axis=0)
+        if len(self._cov_cholesky) == 1:
+            # whiten traces and class means with shared cholesky factor
+            L = self._cov_cholesky[0]
+            whitened_traces = solve_triangular(L, np.transpose(traces), lower=True).T
+            whitened_means = solve_triangular(L, self.means.T, lower=True).T
 
-        # generate distribution for every output class
-        distributions = {
-            output_class: multivariate_normal(
-                mean=meanVectors[output_class],
-                cov=pooledCov,                        # use this for pooled TA
-                # cov=covMatrices[output_class],        # use this for regular TA
-                # allow_singular=True                   # use this if needed
+            # squared mahalanobis distance of every trace to every class mean
+            maha = (
+                np.sum(whitened_traces**2, axis=1)[:, np.newaxis]
+                - 2 * whitened_traces @ whitened_means.T
+                + np.sum(whitened_means**2, axis=1)[np.newaxis, :]
             )
-            for output_class in output_classes
-        }
+        else:
+            # whiten traces with cholesky factor of every class
+            maha = np.empty((len(traces), len(self.classes)))
+            for class_index, (mean, L) in enumerate(zip(self.means, self._cov_cholesky)):
+                whitened_traces = solve_triangular(
+                    L, np.transpose(traces - mean), lower=True)
+                maha[:, class_index] = np.sum(whitened_traces**2, axis=0)
+
+        return -0.5 * (maha + self._log_dets + n_features * np.log(2 * np.pi))
+
+    def _create_class_index_table(self):
+        # output class of every (plain text, key guess) pair (other output
+        # functions are tabulated first)
+        table = self.output_fn
+        if not isinstance(table, LeakageTable):
+            table = LeakageTable(table)
+        outputs = table.all_guesses(self.subkeys)
+
+        # position of output class in templates (-1 if there is no template)
+        class_indexes = np.searchsorted(self.classes, outputs)
+        class_indexes = np.minimum(class_indexes, len(self.classes) - 1)
+        class_indexes[self.classes[class_indexes] != outputs] = -1
 
-        return distributions
+        return class_indexes
+
+    def _class_indexes(self, plain_text):
+        class_indexes = self._class_index_table[plain_text]
+
+        if np.any(class_indexes < 0):
+            raise KeyError(
+                "No template for some of the output classes of given plain text")
+
+        return class_indexes
 
     def logpdfs(self, traces, plain_text, use_cache=False):
 
         if use_cache and self._logpdfs is not None:
             return self._logpdfs
 
-        # calculate logpdfs for every key guess
-        self._logpdfs = np.zeros((len(traces), len(self.subkeys)))
-        for example_index, (trace, plain_text) in enumerate(zip(traces, plain_text)):
-            for subkey_guess in self.subkeys:
-                output = self.output_fn(plain_text, subkey_guess)
-
-                rv = self.distributions[output]
-                self._logpdfs[example_index, subkey_guess] += rv.logpdf(trace)
+        self._logpdfs = self._key_guess_logpdfs(traces, plain_text)
 
         return self._logpdfs
 
-    def create_template(self, traces, plain_text=None, key=None, output=None):
+    def _key_guess_logpdfs(self, traces, plain_text):
+
+        if self.classes is None:
+            self.finalize_template()
+
+        # calculate logpdfs for every class once and gather them for
+        # every key guess
+        class_logpdfs = self._class_logpdfs(traces)
+        class_indexes = self._class_indexes(plain_text)
+
+        return np.take_along_axis(class_logpdfs, class_indexes, axis=1)
+
+    def _get_output(self, plain_text, key, output):
 
         if output is None:
             if plain_text is None or key is None:
@@ -75,9 +200,46 @@ class TemplateAttack(BaseEstimator, ClassifierMixin):
                 raise Warning(
                     "'plain_text' and 'key' are ignored when using 'oputput'")
 
+        return output
+
+    def create_template(self, traces, plain_text=None, key=None, output=None):
+
+        self.statistics = None  # reset statistics
+        self.update_template(traces, plain_text, key, output)
+        self.finalize_template()
+
+    def fit_statistics(self, statistics):
+        """Creates templates from precomputed class statistics of traces
+        (with full scatter matrices)."""
+        self.statistics = statistics
+        self.finalize_template()
+        return self
+
+    def update_template(self, traces, plain_text=None, key=None, output=None):
+        """Adds traces to template statistics. Templates are finalized
+        on demand (first time they are used or by calling finalize_template).
+        """
+        output = self._get_output(plain_text, key, output)
+
+        if self.statistics is None:
+            self.statistics = ClassStatistics()
+        self.statistics.update(traces, output)
+
+        # templates are outdated
+        self._logpdfs = None
+        self.classes = None
+
+    def finalize_template(self):
+
+        if self.statistics is None:
+            raise RuntimeError("Template has no traces, call 'fit' first")
+
         self._logpdfs = None  # reset logpdfs
-        self.distributions = self._create_template_distrubutions(
-            traces, output)
+        (self.classes,
+         self.means,
+         self._cov_cholesky,
+         self._log_dets) = self._create_template_distrubutions(self.statistics)
+        self._class_index_table = self._create_class_index_table()
 
     def guess_key(self, traces, plain_text, number_of_traces=None, use_cache=False):
         N, _ = traces.shape
@@ -89,20 +251,69 @@ class TemplateAttack(BaseEstimator, ClassifierMixin):
 
         return logpdfs.sum(axis=0).argmax()
 
+    def rank_keys_online(self, chunks, n_stable_traces=None):
+        """Attacks traces chunk by chunk, keeping only running sum of
+        log likelihoods of key guesses (logpdfs are never stored).
+
+        Args:
+            chunks: iterable of (traces, plain_text, ...) tuples, e.g.
+                TraceSet.batches (other elements of tuple are ignored)
+            n_stable_traces (int): stop when best key guess has not changed
+                for this number of traces (None to use all chunks)
+
+        Yields:
+            (int, np.ndarray, np.ndarray): number of traces used so far,
+                key guesses ranked from best to worst and their log
+                likelihoods
+        """
+        log_likelihoods = np.zeros(len(self.subkeys))
+        n_traces = 0
+
+        best_guess = None
+        best_guess_since = 0
+        for traces, plain_text, *_ in chunks:
+            log_likelihoods += self._key_guess_logpdfs(traces, plain_text).sum(axis=0)
+            n_traces += len(traces)
+
+            ranking = np.argsort(-log_likelihoods, kind="stable")
+            if ranking[0] != best_guess:
+                best_guess = ranking[0]
+                best_guess_since = n_traces
+
+            yield n_traces, ranking, log_likelihoods.copy()
+
+            if n_stable_traces is not None and n_traces - best_guess_since >= n_stable_traces:
+                return
+
+    def guess_key_online(self, chunks, n_stable_traces=None):
+        """Best key guess after online attack (see rank_keys_online)."""
+        ranking = None
+        for _, ranking, _ in self.rank_keys_online(chunks, n_stable_traces):
+            pass
+
+        if ranking is None:
+            raise ValueError("No traces to attack")
+
+        return ranking[0]
+
     def fit(self, X, y):
-        traces = X[:, :-1]
-        plain = X[:, -1].astype(np.int8)
+        traces, plain = _split_traces_plain(X)
 
         self.create_template(traces=traces,
                              plain_text=plain, key=y)
         return self
 
+    def partial_fit(self, X, y):
+        traces, plain = _split_traces_plain(X)
+
+        self.update_template(traces=traces,
+                             plain_text=plain, key=y)
+        return self
+
     def predict(self, X):
-        traces = X[:, :-1]
-        plain = X[:, -1].astype(np.int8)
+        traces, plain = _split_traces_plain(X)
         return self.guess_key(traces, plain)
 
     def predict_proba(self, X):
-        traces = X[:, :-1]
-        plain = X[:, -1].astype(np.int8)
+        traces, plain = _split_traces_plain(X)
         return self.logpdfs(traces, plain)
@@ -22,12 +22,27 @@ sbox = np.array([
     0x8c, 0xa1, 0x89, 0x0d, 0xbf, 0xe6, 0x42, 0x68, 0x41, 0x99, 0x2d, 0x0f, 0xb0, 0x54, 0xbb, 0x16
 ])
 
+inv_sbox = np.argsort(sbox)
+
+rcon = np.array([0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1b, 0x36])
+
+# multiplication by 2 in GF(2^8)
+xtime = np.array([((b << 1) ^ (0x1b if b & 0x80 else 0)) & 0xff for b in range(256)])
+
+# byte positions after ShiftRows (state is stored column by column)
+shift_rows = np.array([0, 5, 10, 15, 4, 9, 14, 3, 8, 13, 2, 7, 12, 1, 6, 11])
+
 hamming = np.array([bin(subkey).count("1") for subkey in subkeys])
 
 
 class LeakageModel(Enum):
     intermediate = auto()
     HW = auto()
+    HD = auto()
+    LSB = auto()
+    MSB = auto()
+    last_round = auto()
+    last_round_HW = auto()
 
 
 def aes_output(plain, key):
@@ -38,11 +53,133 @@ def aes_output_HW(plain, key):
     return hamming[aes_output(plain, key)]
 
 
+def aes_output_HD(plain, key):
+    # distance between sbox input and sbox output
+    return hamming[aes_output(plain, key) ^ plain ^ key]
+
+
+def aes_output_LSB(plain, key):
+    return aes_output(plain, key) & 1
+
+
+def aes_output_MSB(plain, key):
+    return aes_output(plain, key) >> 7
+
+
+# for last round models plain is a ciphertext byte and key is a last round
+# key byte, the output is the sbox input of the last round (inverse sbox
+# of ciphertext xor key, ShiftRows only moves bytes)
+def aes_last_round_output(cipher, key):
+    return inv_sbox[cipher ^ key]
+
+
+def aes_last_round_output_HW(cipher, key):
+    return hamming[aes_last_round_output(cipher, key)]
+
+
+class LeakageTable:
+    """Output function backed by a precomputed table of output classes
+    for every (plain, key) byte pair.
+
+    Calling it is equivalent to calling the wrapped output function, but
+    it costs only a single lookup in the table.
+    """
+
+    def __init__(self, output_fn):
+        values = np.arange(256)
+        self.table = output_fn(
+            values[:, np.newaxis],
+            values[np.newaxis, :]
+        ).astype(np.uint8)
+
+    def __call__(self, plain, key):
+        return self.table[plain, key]
+
+    @property
+    def n_classes(self):
+        """Number of different output classes."""
+        return len(np.unique(self.table))
+
+    def all_guesses(self, plain):
+        """Returns output classes of every plain byte for all 256 key
+        guesses as array with shape (len(plain), 256)."""
+        return self.table[plain]
+
+
 leakage_to_output_fn = {
     LeakageModel.intermediate: aes_output,
     LeakageModel.HW: aes_output_HW,
+    LeakageModel.HD: aes_output_HD,
+    LeakageModel.LSB: aes_output_LSB,
+    LeakageModel.MSB: aes_output_MSB,
+    LeakageModel.last_round: aes_last_round_output,
+    LeakageModel.last_round_HW: aes_last_round_output_HW,
+}
+
+leakage_to_table = {
+    leakage_model: LeakageTable(output_fn)
+    for leakage_model, output_fn in leakage_to_output_fn.items()
 }
 
 
 def get_aes_output_for_leakage(leakage_model: LeakageModel):
-    return leakage_to_output_fn[leakage_model]
+    return leakage_to_table[leakage_model]
+
+
+def _expand_keys(keys):
+    # round keys for every key, shape (n_keys, 11, 16)
+    round_keys = np.zeros((len(keys), 11, 16), dtype=np.int64)
+    round_keys[:, 0] = keys
+
+    for round_index in range(1, 11):
+        previous = round_keys[:, round_index - 1]
+
+        # RotWord, SubWord and Rcon on last word of previous round key
+        word = sbox[np.roll(previous[:, 12:16], -1, axis=1)]
+        word[:, 0] ^= rcon[round_index - 1]
+
+        for word_index in range(4):
+            word = word ^ previous[:, 4*word_index:4*word_index+4]
+            round_keys[:, round_index, 4*word_index:4*word_index+4] = word
+
+    return round_keys
+
+
+def _mix_columns(state):
+    columns = state.reshape(-1, 4, 4)
+    a0, a1, a2, a3 = (columns[:, :, row] for row in range(4))
+    total = a0 ^ a1 ^ a2 ^ a3
+
+    mixed = np.stack([
+        a0 ^ total ^ xtime[a0 ^ a1],
+        a1 ^ total ^ xtime[a1 ^ a2],
+        a2 ^ total ^ xtime[a2 ^ a3],
+        a3 ^ total ^ xtime[a3 ^ a0],
+    ], axis=2)
+
+    return mixed.reshape(-1, 16)
+
+
+def aes_encrypt(plaintext, keys):
+    """AES-128 encryption of plaintext with every key (vectorized over keys).
+
+    Args:
+        plaintext: 16 bytes (same for all keys) or array with shape (n_keys, 16)
+        keys: array with shape (n_keys, 16)
+
+    Returns:
+        np.ndarray: ciphertexts with shape (n_keys, 16) and dtype uint8
+    """
+    keys = np.atleast_2d(keys).astype(np.int64)
+    round_keys = _expand_keys(keys)
+
+    state = np.broadcast_to(np.asarray(plaintext, dtype=np.int64), keys.shape)
+    state = state ^ round_keys[:, 0]
+
+    for round_index in range(1, 11):
+        state = sbox[state][:, shift_rows]
+        if round_index != 10:
+            state = _mix_columns(state)
+        state = state ^ round_keys[:, round_index]
+
+    return state.astype(np.uint8)
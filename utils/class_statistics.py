@@ -0,0 +1,330 @@
+import joblib
+import numpy as np
+
+
+def sort_by_class(traces, y_indexes, n_classes):
+    """Traces sorted by class index (stable), counts of classes and start
+    of block of every class in sorted traces, so per class sums, minimums
+    etc. are computed by ufunc.reduceat without a pass per class."""
+    counts = np.bincount(y_indexes, minlength=n_classes)
+    order = np.argsort(y_indexes, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return np.asarray(traces)[order], counts, starts
+
+
+def _traces_hash(traces):
+    # same hash for equal traces in any memory layout
+    return joblib.hash(np.ascontiguousarray(traces))
+
+
+class ClassStatistics:
+    """Running per class statistics of traces (counts, means, scatter
+    matrices, minimums and maximums) that can be updated with chunks of
+    traces.
+
+    Chunks are merged with pairwise update formulas (Chan et al.) so
+    statistics stay numerically stable no matter how many chunks are used.
+    Statistics of disjoint sets of traces are additive, statistics of
+    their union is obtained by merging them.
+
+    Covariance of class is scatter / (count - 1), same as np.cov. If
+    full_scatter is False only diagonal of scatter matrices is kept
+    (shape (n_classes, n_features) instead of
+    (n_classes, n_features, n_features)), which is enough for per
+    feature measures on long traces.
+    """
+
+    def __init__(self, full_scatter=True):
+        self.full_scatter = full_scatter
+        self.classes = None
+        self.counts = None
+        self.means = None
+        self.scatters = None
+        self.minimums = None
+        self.maximums = None
+
+    @classmethod
+    def from_partitions(cls, traces, y, partitions, full_scatter=True):
+        """Statistics for every partition (array of trace indexes)."""
+        return [
+            cls(full_scatter).update(traces[partition], y[partition])
+            for partition in partitions
+        ]
+
+    @property
+    def n_samples(self):
+        return self.counts.sum()
+
+    @property
+    def n_features(self):
+        return None if self.means is None else self.means.shape[1]
+
+    @property
+    def covariances(self):
+        if not self.full_scatter:
+            raise ValueError("Covariances need statistics with full scatter matrices")
+        return self.scatters / (self.counts - 1)[:, np.newaxis, np.newaxis]
+
+    @property
+    def variances(self):
+        """Per class variances of features (ddof=1)."""
+        return self._scatter_diagonals() / (self.counts - 1)[:, np.newaxis]
+
+    def total_mean(self):
+        return self.counts @ self.means / self.n_samples
+
+    def total_scatter_diagonal(self):
+        """Sum of squared deviations of every feature from its total mean."""
+        deviations = self.means - self.total_mean()
+        return (
+            np.sum(self._scatter_diagonals(), axis=0)
+            + self.counts @ deviations**2
+        )
+
+    def is_constant(self):
+        """Mask of features with the same value in all traces."""
+        return self.minimums.min(axis=0) == self.maximums.max(axis=0)
+
+    def select_features(self, features):
+        """Statistics of selected features only."""
+        selected = ClassStatistics(self.full_scatter)
+        selected.classes = self.classes.copy()
+        selected.counts = self.counts.copy()
+        selected.means = self.means[:, features]
+        if self.full_scatter:
+            selected.scatters = self.scatters[:, features][:, :, features]
+        else:
+            selected.scatters = self.scatters[:, features]
+        selected.minimums = self.minimums[:, features]
+        selected.maximums = self.maximums[:, features]
+        return selected
+
+    def _scatter_diagonals(self):
+        if self.full_scatter:
+            return np.diagonal(self.scatters, axis1=1, axis2=2)
+        return self.scatters
+
+    def update(self, traces, y):
+        """Adds chunk of traces with their output classes to statistics."""
+        traces = np.asarray(traces)
+        y = np.asarray(y)
+
+        if self.n_features is not None and traces.shape[1] != self.n_features:
+            raise ValueError(
+                f"Expected traces with {self.n_features} features, got {traces.shape[1]}")
+
+        chunk_classes, y_indexes = np.unique(y, return_inverse=True)
+        n_classes = len(chunk_classes)
+
+        # mean and range of every class in chunk (every class of chunk has
+        # at least one trace, so no block is empty)
+        sorted_traces, chunk_counts, starts = sort_by_class(traces, y_indexes, n_classes)
+        chunk_means = np.add.reduceat(sorted_traces, starts, axis=0, dtype=np.float64)
+        chunk_means /= chunk_counts[:, np.newaxis]
+        chunk_minimums = np.minimum.reduceat(sorted_traces, starts, axis=0).astype(np.float64)
+        chunk_maximums = np.maximum.reduceat(sorted_traces, starts, axis=0).astype(np.float64)
+
+        # classes are contiguous blocks of sorted traces, only one block
+        # is converted to float at once
+        chunk_scatters = np.empty(self._scatter_shape(n_classes, traces.shape[1]))
+        for class_index, (start, count) in enumerate(zip(starts, chunk_counts)):
+            centered = sorted_traces[start:start + count] - chunk_means[class_index]
+            if self.full_scatter:
+                chunk_scatters[class_index] = centered.T @ centered
+            else:
+                chunk_scatters[class_index] = np.einsum("ij,ij->j", centered, centered)
+
+        self._merge(chunk_classes, chunk_counts, chunk_means, chunk_scatters,
+                    chunk_minimums, chunk_maximums)
+        return self
+
+    def merge(self, other):
+        """Adds statistics of other (disjoint) set of traces."""
+        if other.classes is None:
+            return self
+
+        scatters = other.scatters
+        if other.full_scatter and not self.full_scatter:
+            scatters = other._scatter_diagonals()
+        elif self.full_scatter and not other.full_scatter:
+            raise ValueError("Can't merge diagonal scatters into full scatters")
+
+        self._merge(other.classes, other.counts, other.means, scatters,
+                    other.minimums, other.maximums)
+        return self
+
+    def __add__(self, other):
+        return ClassStatistics(self.full_scatter).merge(self).merge(other)
+
+    def _scatter_shape(self, n_classes, n_features):
+        if self.full_scatter:
+            return (n_classes, n_features, n_features)
+        return (n_classes, n_features)
+
+    def _merge(self, classes, counts, means, scatters, minimums, maximums):
+        if self.classes is None:
+            self.classes = classes.copy()
+            self.counts = counts.copy()
+            self.means = means.copy()
+            self.scatters = scatters.copy()
+            self.minimums = minimums.copy()
+            self.maximums = maximums.copy()
+            return
+
+        # make room for classes seen for the first time
+        all_classes = np.union1d(self.classes, classes)
+        if len(all_classes) > len(self.classes):
+            self._reindex(all_classes)
+
+        indexes = np.searchsorted(self.classes, classes)
+
+        count_a = self.counts[indexes].astype(np.float64)
+        count_b = counts.astype(np.float64)
+        count = count_a + count_b
+
+        # combine means and scatters of both parts
+        delta = means - self.means[indexes]
+        weight = count_a * count_b / count
+        if self.full_scatter:
+            delta_scatters = (
+                delta[:, :, np.newaxis] * delta[:, np.newaxis, :]
+                * weight[:, np.newaxis, np.newaxis]
+            )
+        else:
+            delta_scatters = delta**2 * weight[:, np.newaxis]
+
+        self.means[indexes] += delta * (count_b / count)[:, np.newaxis]
+        self.scatters[indexes] += scatters + delta_scatters
+        self.counts[indexes] += counts
+
+        # classes seen for the first time have no range yet
+        new = count_a == 0
+        self.minimums[indexes] = np.where(
+            new[:, np.newaxis], minimums, np.minimum(self.minimums[indexes], minimums))
+        self.maximums[indexes] = np.where(
+            new[:, np.newaxis], maximums, np.maximum(self.maximums[indexes], maximums))
+
+    def _reindex(self, all_classes):
+        indexes = np.searchsorted(all_classes, self.classes)
+
+        n_classes, n_features = len(all_classes), self.n_features
+
+        counts = np.zeros(n_classes, dtype=self.counts.dtype)
+        means = np.zeros((n_classes, n_features))
+        scatters = np.zeros(self._scatter_shape(n_classes, n_features))
+        minimums = np.zeros((n_classes, n_features))
+        maximums = np.zeros((n_classes, n_features))
+
+        counts[indexes] = self.counts
+        means[indexes] = self.means
+        scatters[indexes] = self.scatters
+        minimums[indexes] = self.minimums
+        maximums[indexes] = self.maximums
+
+        self.classes = all_classes
+        self.counts, self.means, self.scatters = counts, means, scatters
+        self.minimums, self.maximums = minimums, maximums
+
+
+class FoldStatistics:
+    """Class statistics of cross validation training folds.
+
+    Statistics are computed once for every test fold (partition of traces)
+    and statistics of training fold are obtained by merging statistics of
+    all other partitions, so traces are scanned only once no matter how
+    many times folds are refitted (e.g. for every point of a grid search).
+
+    Transformers that get FoldStatistics recognize training traces of a
+    fold (or all traces, used for refit) with lookup and use precomputed
+    statistics instead of scanning traces again. Folds are recognized by
+    content hash of all their training traces (computed once per fold),
+    n_probes traces are compared first so other traces are rejected
+    without hashing them.
+
+    Args:
+        traces: all training traces
+        y: output classes of traces
+        splits: list of (train, test) index arrays, test folds must be
+            disjoint and cover all traces (e.g. KFold)
+        full_scatter (bool): see ClassStatistics
+        n_probes (int): number of traces compared before hashing
+    """
+
+    def __init__(self, traces, y, splits, full_scatter=False, n_probes=16):
+        self.traces = traces
+        self.y = np.asarray(y)
+        self.splits = list(splits)
+        self.n_probes = n_probes
+
+        self.partitions = ClassStatistics.from_partitions(
+            traces, self.y, [test for _, test in self.splits], full_scatter)
+
+        # content hashes of training traces of folds ("all" for all
+        # traces), computed on first lookup of fold
+        self._hashes = {}
+
+    def __deepcopy__(self, memo):
+        # statistics are never modified, so they are shared between clones
+        # of estimators that use them (e.g. in grid search)
+        return self
+
+    def train(self, fold):
+        """Statistics of training traces of fold."""
+        statistics = ClassStatistics(self.partitions[fold].full_scatter)
+        for i, partition in enumerate(self.partitions):
+            if i != fold:
+                statistics.merge(partition)
+        return statistics
+
+    def all(self):
+        statistics = ClassStatistics(self.partitions[0].full_scatter)
+        for partition in self.partitions:
+            statistics.merge(partition)
+        return statistics
+
+    def _training_indexes(self, fold):
+        if fold == "all":
+            return np.arange(len(self.traces))
+        return np.asarray(self.splits[fold][0])
+
+    def _hash(self, fold):
+        if fold not in self._hashes:
+            self._hashes[fold] = _traces_hash(self.traces[self._training_indexes(fold)])
+        return self._hashes[fold]
+
+    def _may_match(self, traces, y, indexes):
+        if len(traces) != len(indexes):
+            return False
+
+        probes = np.linspace(0, len(indexes) - 1, self.n_probes).astype(int)
+        return (
+            np.array_equal(traces[probes], self.traces[indexes[probes]])
+            and (y is None or np.array_equal(y, self.y[indexes]))
+        )
+
+    def fold_index(self, traces, y=None):
+        """Index of fold whose training traces are traces, "all" if traces
+        are all traces, None otherwise."""
+        y = None if y is None else np.asarray(y)
+
+        traces_hash = None
+        for fold in [*range(len(self.splits)), "all"]:
+            if not self._may_match(traces, y, self._training_indexes(fold)):
+                continue
+
+            if traces_hash is None:
+                traces_hash = _traces_hash(traces)
+            if traces_hash == self._hash(fold):
+                return fold
+
+        return None
+
+    def lookup(self, traces, y=None):
+        """Precomputed statistics if traces are training traces of one of
+        the folds or all traces, None otherwise."""
+        fold = self.fold_index(traces, y)
+        if fold is None:
+            return None
+        if fold == "all":
+            return self.all()
+        return self.train(fold)
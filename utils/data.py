@@ -1,115 +1,187 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
 
 import h5py
 import numpy as np
 
+from utils.aes import LeakageModel, get_aes_output_for_leakage
+from utils.profiling import profile_stage
+from utils.run_manifest import write_atomic
 
-def load_data_ASCAD(filename, target_byte=None):
-
-    file = h5py.File(str(filename)+".h5")
-
-    profile = file["Profiling_traces"]
-    attack = file["Attack_traces"]
-
-    profiling_traces = np.array(profile["traces"])
-    profiling_plaintext = profile["metadata"]["plaintext"]
-    profiling_key = profile["metadata"]["key"]
-
-    attack_traces = np.array(attack["traces"])
-    attack_plaintext = attack["metadata"]["plaintext"]
-    attack_key = attack["metadata"]["key"]
-
-    if target_byte:
-        profiling_plaintext = profiling_plaintext[:, target_byte]
-        profiling_key = profiling_key[:, target_byte]
-        attack_plaintext = attack_plaintext[:, target_byte]
-        attack_key = attack_key[:, target_byte]
-        
-    #!!!!!!using smaller dataset    
-    profilingTracesShort = profiling_traces[:5000]
-    profilingPlaintextShort = profiling_plaintext[:5000]
-    profilingKeyShort = profiling_key[:5000]
-    
-    attackTracesShort = attack_traces[:1000]
-    attackPlaintextShort = attack_plaintext[:1000]
-    attackKeyShort = attack_key[:1000]
-
-#!!!!!!uncomment if not using smaller dataset!!!!!!
-#    return (
-#        (profiling_traces, profiling_plaintext, profiling_key),
-#        (attack_traces, attack_plaintext, attack_key)
-#    )
-    
-#!!!!!!comment if not using smaller dataset!!!!!!
-    return (
-        (profilingTracesShort, profilingPlaintextShort, profilingKeyShort),
-        (attackTracesShort, attackPlaintextShort, attackKeyShort)
-    )
 
+class TraceSet:
+    """Lazily loaded part of dataset (traces, plaintext and key of traces
+    selected by indexes).
 
-def load_data_ches_ctf(filename):
-
-    file = h5py.File(str(filename)+".h5")
-
-    profiling_traces = np.array(file.get('profiling_traces'))
-    profiling_data = np.array(file.get('profiling_data'))
-    attack_traces = np.array(file.get('attacking_traces'))
-    attack_data = np.array(file.get('attacking_data'))
-
-    (profiling_plaintext,
-     profiling_output,
-     profiling_key) = np.split(profiling_data, [16, 32], axis=1)
-
-    (attack_plaintext,
-     attack_output,
-     attack_key) = np.split(attack_data, [16, 32], axis=1)
-    
-    #!!!!!!using smaller dataset    
-    profilingTracesShort = profiling_traces[:5000]
-    profilingPlaintextShort = profiling_plaintext[:5000]
-    profilingKeyShort = profiling_key[:5000]
-    
-    attackTracesShort = attack_traces[:1000]
-    attackPlaintextShort = attack_plaintext[:1000]
-    attackKeyShort = attack_key[:1000]
-
-
-    #!!!!!!uncomment if not using smaller dataset!!!!!!
-#    return (
-#        (profiling_traces, profiling_plaintext, profiling_key),
-#        (attack_traces, attack_plaintext, attack_key)
-#    )
-    
-    #!!!!!!comment if not using smaller dataset!!!!!!
-    return (
-        (profilingTracesShort, profilingPlaintextShort, profilingKeyShort),
-        (attackTracesShort, attackPlaintextShort, attackKeyShort)
-    )
+    Nothing is read until data is requested (load, batches or indexing),
+    then only selected traces are read and file is open only while reading.
 
+    Args:
+        open_file: function returning context manager with opened file
+        read: function (file, selection) -> (traces, plaintext, key)
+            reading selected traces (slice or increasing indexes)
+        indexes (np.ndarray): indexes of traces in dataset
+        target_byte (int): if given, only this byte of plaintext and key
+            is returned
+    """
 
-def load_data_chipwhisperer(data_root):
+    def __init__(self, open_file, read, indexes, target_byte=None):
+        self.open_file = open_file
+        self.read = read
+        self.indexes = np.asarray(indexes)
+        self.target_byte = target_byte
 
-    data_root = Path(data_root)
+    def __len__(self):
+        return len(self.indexes)
 
-    traces = np.load(data_root/"traces.npy")
-    pt = np.load(data_root/"plain.npy")
-    key = np.load(data_root/"key.npy")
+    def __getitem__(self, item):
+        return self._read(self.indexes[item])
 
-    train_slice = slice(0, 2000)
-    test_slice = slice(9990, 10000)
+    def load(self):
+        """Returns (traces, plaintext, key) of all selected traces."""
+        return self._read(self.indexes)
 
-    profiling_traces = traces[train_slice]
-    profiling_plaintext = pt[train_slice]
-    profiling_key = key[train_slice]
+    def batches(self, batch_size):
+        """Iterates over (traces, plaintext, key) of batch_size traces."""
+        for batch_start in range(0, len(self), batch_size):
+            yield self._read(self.indexes[batch_start:batch_start+batch_size])
 
-    attack_traces = traces[test_slice]
-    attack_plaintext = pt[test_slice]
-    attack_key = key[test_slice]
+    def _read(self, indexes):
+        # hdf5 supports only increasing indexes, so read unique sorted
+        # indexes and restore requested order afterwards
+        indexes = np.atleast_1d(indexes)
+        unique_indexes, inverse = np.unique(indexes, return_inverse=True)
+
+        with self.open_file() as file:
+            data = self.read(file, _as_selection(unique_indexes))
+
+        if len(unique_indexes) != len(indexes) or np.any(np.diff(indexes) < 0):
+            data = tuple(array[inverse] for array in data)
+
+        traces, plaintext, key = data
+        if self.target_byte is not None:
+            plaintext = plaintext[:, self.target_byte]
+            key = key[:, self.target_byte]
+
+        return traces, plaintext, key
+
+
+def _as_selection(indexes):
+    # contiguous indexes are read as hyperslab
+    if len(indexes) > 0 and indexes[-1] - indexes[0] + 1 == len(indexes):
+        return slice(int(indexes[0]), int(indexes[-1]) + 1)
+    return indexes
+
+
+def _resolve_indexes(indexes, n_traces):
+    if indexes is None:
+        return np.arange(n_traces)
+    if isinstance(indexes, slice):
+        return np.arange(n_traces)[indexes]
+    return np.asarray(indexes)
+
+
+def _load_parts(open_file, parts, target_byte, lazy):
+    # parts is list of (read, n_traces, indexes)
+    trace_sets = [
+        TraceSet(open_file, read, _resolve_indexes(indexes, n_traces), target_byte)
+        for read, n_traces, indexes in parts
+    ]
+
+    if lazy:
+        return tuple(trace_sets)
+
+    return tuple(trace_set.load() for trace_set in trace_sets)
+
+
+def _open_h5(filename):
+    return partial(h5py.File, str(filename)+".h5", "r")
+
+
+def _read_ASCAD_group(group_name, file, selection):
+    group = file[group_name]
+    metadata = group["metadata"][selection]
+    return group["traces"][selection], metadata["plaintext"], metadata["key"]
+
+
+def load_data_ASCAD(filename, target_byte=None,
+                    profiling_indexes=slice(0, 5000), attack_indexes=slice(0, 1000),
+                    lazy=False):
+    """Loads profiling and attack traces of ASCAD dataset, only traces
+    selected by profiling_indexes and attack_indexes (slice, array of
+    indexes or None for all traces) are read.
+
+    If lazy is True returns TraceSet objects instead of
+    (traces, plaintext, key) tuples.
+    """
+    open_file = _open_h5(filename)
+    with open_file() as file:
+        n_profiling = len(file["Profiling_traces/traces"])
+        n_attack = len(file["Attack_traces/traces"])
+
+    return _load_parts(open_file, [
+        (partial(_read_ASCAD_group, "Profiling_traces"), n_profiling, profiling_indexes),
+        (partial(_read_ASCAD_group, "Attack_traces"), n_attack, attack_indexes),
+    ], target_byte, lazy)
 
-    return (
-        (profiling_traces, profiling_plaintext, profiling_key),
-        (attack_traces, attack_plaintext, attack_key)
-    )
+
+def _read_ches_ctf(traces_name, data_name, file, selection):
+    traces = file[traces_name][selection]
+    data = file[data_name][selection]
+
+    (plaintext,
+     output,
+     key) = np.split(data, [16, 32], axis=1)
+
+    return traces, plaintext, key
+
+
+def load_data_ches_ctf(filename, target_byte=None,
+                       profiling_indexes=slice(0, 5000), attack_indexes=slice(0, 1000),
+                       lazy=False):
+    """Same as load_data_ASCAD but for CHES CTF dataset."""
+    open_file = _open_h5(filename)
+    with open_file() as file:
+        n_profiling = len(file["profiling_traces"])
+        n_attack = len(file["attacking_traces"])
+
+    return _load_parts(open_file, [
+        (partial(_read_ches_ctf, "profiling_traces", "profiling_data"), n_profiling, profiling_indexes),
+        (partial(_read_ches_ctf, "attacking_traces", "attacking_data"), n_attack, attack_indexes),
+    ], target_byte, lazy)
+
+
+@contextmanager
+def _open_chipwhisperer(data_root):
+    yield {
+        name: np.load(Path(data_root)/f"{name}.npy", mmap_mode="r")
+        for name in ("traces", "plain", "key")
+    }
+
+
+def _read_chipwhisperer(file, selection):
+    return file["traces"][selection], file["plain"][selection], file["key"][selection]
+
+
+def load_data_chipwhisperer(data_root, target_byte=None,
+                            profiling_indexes=slice(0, 2000), attack_indexes=slice(9990, 10000),
+                            lazy=False):
+    """Same as load_data_ASCAD but for chipwhisperer dataset (numpy files
+    which are memory mapped, so only selected traces are read)."""
+    open_file = partial(_open_chipwhisperer, data_root)
+    with open_file() as file:
+        n_traces = len(file["traces"])
+
+    return _load_parts(open_file, [
+        (_read_chipwhisperer, n_traces, profiling_indexes),
+        (_read_chipwhisperer, n_traces, attack_indexes),
+    ], target_byte, lazy)
 
 
 string_contains_to_loader = {
@@ -135,16 +207,323 @@ def select_traget_bype(data, target_byte):
     )
 
 
-def load_data(path, target_byte=None):
+############################ preprocessed data cache ##########################
+# Every part (profiling/attack) of loaded dataset is stored as contiguous
+# numpy files (traces in native dtype, plaintext and key of target byte)
+# that are memory mapped on later runs, so processes share them through
+# page cache. Cache entries are keyed by content hash of source files,
+# loader, target byte and selected indexes.
+
+CACHE_BATCH_SIZE = 10000
+_CACHE_FILES = ("traces", "plaintext", "key")
+
+
+def _source_files(path):
+    h5_file = Path(str(path)+".h5")
+    if h5_file.exists():
+        return [h5_file]
+    return sorted(Path(path).glob("*.npy"))
+
+
+def _file_hash(file, cache_dir):
+    """sha256 of file content, remembered in cache_dir until file changes."""
+    hashes_file = Path(cache_dir)/"source_hashes.json"
+    hashes = json.loads(hashes_file.read_text()) if hashes_file.exists() else {}
+
+    stat = os.stat(file)
+    file_id = str(Path(file).resolve())
+    entry = hashes.get(file_id)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    sha256 = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(partial(f.read, 2**24), b""):
+            sha256.update(block)
+
+    # other processes may have added hashes while this file was hashed,
+    # file is replaced atomically so readers never see partial file
+    hashes = json.loads(hashes_file.read_text()) if hashes_file.exists() else {}
+    hashes[file_id] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256.hexdigest()
+    }
+    write_atomic(hashes_file, json.dumps(hashes, indent=1))
+
+    return sha256.hexdigest()
+
+
+@contextmanager
+def _open_cache_entry(entry_dir):
+    yield {
+        name: np.load(Path(entry_dir)/f"{name}.npy", mmap_mode="r")
+        for name in _CACHE_FILES
+    }
+
+
+def _read_cache_entry(file, selection):
+    return tuple(file[name][selection] for name in _CACHE_FILES)
+
+
+def _write_cache_entry(trace_set, entry_dir):
+    # write to temporary directory first, so entry appears atomically
+    tmp_dir = Path(tempfile.mkdtemp(dir=entry_dir.parent, prefix=".tmp_"))
+    try:
+        arrays = None
+        position = 0
+        for batch in trace_set.batches(CACHE_BATCH_SIZE):
+            if arrays is None:
+                arrays = [
+                    np.lib.format.open_memmap(
+                        tmp_dir/f"{name}.npy", mode="w+", dtype=array.dtype,
+                        shape=(len(trace_set), *array.shape[1:]))
+                    for name, array in zip(_CACHE_FILES, batch)
+                ]
+
+            for array, batch_array in zip(arrays, batch):
+                array[position:position+len(batch_array)] = batch_array
+            position += len(batch[0])
+
+        if arrays is None:
+            raise ValueError("Can't cache part of dataset without traces")
+
+        for array in arrays:
+            array.flush()
+        del arrays
+
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # other process wrote the same entry first (directory can't
+            # replace non-empty directory), its entry is used
+            if not entry_dir.exists():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _cached_trace_set(trace_set, source_hash, loader_name, part, cache_dir):
+    key = hashlib.sha256()
+    key.update(f"{source_hash};{loader_name};{part};{trace_set.target_byte};".encode())
+    key.update(np.ascontiguousarray(trace_set.indexes, dtype=np.int64).tobytes())
+
+    entry_dir = Path(cache_dir)/f"{loader_name}_{part}_{key.hexdigest()[:16]}"
+    if not entry_dir.exists():
+        # entry can appear while it is written (by other process), then
+        # the existing entry is kept
+        _write_cache_entry(trace_set, entry_dir)
+
+    return TraceSet(
+        partial(_open_cache_entry, entry_dir), _read_cache_entry,
+        np.arange(len(trace_set))
+    )
+
+
+def load_data_cached(loader, path, target_byte=None, cache_dir="cache", lazy=False,
+                     **loader_kwargs):
+    """Same as loader(path, target_byte, ...), but data is read from
+    cache_dir (and written there on first use)."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    source_hash = hashlib.sha256("".join(
+        _file_hash(file, cache_dir) for file in _source_files(path)
+    ).encode()).hexdigest()
+
+    trace_sets = loader(path, target_byte, lazy=True, **loader_kwargs)
+
+    trace_sets = tuple(
+        _cached_trace_set(trace_set, source_hash, loader.__name__, part, cache_dir)
+        for part, trace_set in zip(("profiling", "attack"), trace_sets)
+    )
+
+    if lazy:
+        return trace_sets
+
+    return tuple(trace_set.load() for trace_set in trace_sets)
+
+
+def load_data(path, target_byte=None, cache_dir=None, profiler=None, **loader_kwargs):
+    """Loads dataset with loader selected by path, loader_kwargs
+    (profiling_indexes, attack_indexes, lazy) are passed to loader.
+
+    If cache_dir is given data is loaded through preprocessed data cache
+    (see load_data_cached). If profiler is given, loading is recorded as
+    stage named by loader.
+    """
 
-    data = None
     for string, loader in string_contains_to_loader.items():
         if string in str(path):
-            data = loader(path)
-            if target_byte is not None:
-                data = select_traget_bype(data, target_byte)
-            return data
+            with profile_stage(profiler, loader.__name__, "load"):
+                if cache_dir is not None:
+                    return load_data_cached(loader, path, target_byte, cache_dir,
+                                            **loader_kwargs)
+                return loader(path, target_byte, **loader_kwargs)
 
     raise RuntimeError(
         f"Unrecognized dataset, currently supported are {string_contains_to_loader.keys()}"
     )
+
+
+############################# synthetic datasets ##############################
+# Traces with known leakage of target byte, so hot paths can be benchmarked
+# (and experiments tried out) without dataset files. Generated data has the
+# same format as data returned by loaders and can be written in format of
+# chipwhisperer or ASCAD dataset to benchmark loaders.
+
+def _leakage_values(values, distribution):
+    # values scaled to zero mean and unit variance, distribution contains
+    # all values with their probabilities (e.g. output table of leakage
+    # model for all uniform plaintext and key bytes, binomial for HW)
+    std = np.std(distribution)
+    return (values - np.mean(distribution)) / (std if std > 0 else 1)
+
+
+def _add_leakage(traces, positions, shifts, leakage):
+    rows = np.arange(len(traces))
+    for position in positions:
+        traces[rows, position + shifts] += leakage.astype(traces.dtype)
+
+
+def generate_synthetic_data(n_profiling=5000, n_attack=1000, n_features=700,
+                            leakage_model=LeakageModel.HW, leakage_positions=None,
+                            leakage_amplitude=1.0, noise=1.0, desync=0, masked=False,
+                            mask_positions=None, dtype=np.float32, leaking_byte=0,
+                            random_profiling_key=False, target_byte=None,
+                            random_state=None):
+    """Generates profiling and attack traces of AES, output of
+    leakage_model for leaking_byte of plaintext and key leaks at
+    leakage_positions (by default in the middle of trace).
+
+    Traces are Gaussian noise with standard deviation noise, leakage is
+    output of leakage model standardized by mean and variance of output
+    over uniform plaintext (e.g. binomial for HW and HD) and multiplied by
+    leakage_amplitude, so SNR is (leakage_amplitude / noise)**2. Integer
+    dtypes (e.g. np.int8 as in ASCAD) are scaled to their range and
+    rounded.
+
+    If desync > 0 leakage of every trace is shifted by random offset from
+    [0, desync] (as in desynchronized ASCAD traces). If masked is True
+    output is split into two shares, (output + mask) mod n_classes leaks
+    at leakage_positions and mask at mask_positions (by default half of
+    trace away), so only second order attacks succeed.
+
+    All traces use one random key (same as in chipwhisperer dataset),
+    unless random_profiling_key is True (as in ASCAD variable key
+    dataset).
+
+    Returns:
+        ((traces, plaintext, key), (traces, plaintext, key)) of profiling
+            and attack traces, plaintext and key contain all 16 bytes unless
+            target_byte is given (same as loaders)
+    """
+    rng = np.random.default_rng(random_state)
+    table = get_aes_output_for_leakage(leakage_model).table
+    n_classes = int(table.max()) + 1
+
+    if leakage_positions is None:
+        leakage_positions = n_features // 2
+    leakage_positions = np.atleast_1d(leakage_positions)
+    if mask_positions is None:
+        mask_positions = (leakage_positions + n_features // 2) % n_features
+    mask_positions = np.atleast_1d(mask_positions)
+
+    all_positions = np.concatenate([leakage_positions, mask_positions] if masked
+                                   else [leakage_positions])
+    if all_positions.min() < 0 or all_positions.max() + desync >= n_features:
+        raise ValueError(
+            f"Leakage positions (shifted by up to desync={desync}) must be "
+            f"in range of {n_features} features"
+        )
+
+    fixed_key = rng.integers(0, 256, 16, dtype=np.uint8)
+    integer_dtype = np.issubdtype(dtype, np.integer)
+    # standard_normal generates only float32 and float64
+    noise_dtype = np.float64 if np.dtype(dtype) == np.float64 else np.float32
+
+    parts = []
+    for part, n_traces in (("profiling", n_profiling), ("attack", n_attack)):
+        plaintext = rng.integers(0, 256, (n_traces, 16), dtype=np.uint8)
+        if part == "profiling" and random_profiling_key:
+            key = rng.integers(0, 256, (n_traces, 16), dtype=np.uint8)
+        else:
+            key = np.tile(fixed_key, (n_traces, 1))
+
+        traces = rng.standard_normal((n_traces, n_features), dtype=noise_dtype)
+        traces *= noise
+
+        output = table[plaintext[:, leaking_byte], key[:, leaking_byte]].astype(np.int64)
+        shifts = rng.integers(0, desync + 1, n_traces)
+        if masked:
+            # both shares are uniform over output classes
+            mask = rng.integers(0, n_classes, n_traces)
+            output = (output + mask) % n_classes
+            _add_leakage(traces, mask_positions, shifts,
+                         leakage_amplitude * _leakage_values(mask, np.arange(n_classes)))
+            output_distribution = np.arange(n_classes)
+        else:
+            output_distribution = table
+        _add_leakage(traces, leakage_positions, shifts,
+                     leakage_amplitude * _leakage_values(output, output_distribution))
+
+        if integer_dtype:
+            info = np.iinfo(dtype)
+            # +-4 standard deviations of traces fit into range of dtype
+            scale = min(info.max, -info.min) / (4 * np.hypot(noise, leakage_amplitude))
+            traces = np.clip(np.rint(traces * scale), info.min, info.max)
+        traces = traces.astype(dtype, copy=False)
+
+        if target_byte is not None:
+            plaintext = plaintext[:, target_byte]
+            key = key[:, target_byte]
+
+        parts.append((traces, plaintext, key))
+
+    return tuple(parts)
+
+
+def write_synthetic_data(path, data, file_format="chipwhisperer"):
+    """Writes data generated by generate_synthetic_data (with all 16 bytes
+    of plaintext and key) as dataset that is read by load_data.
+
+    file_format is "chipwhisperer" (numpy files in directory path,
+    profiling and attack traces are concatenated) or "ascad" (path.h5).
+    Name of path must contain name of dataset (see
+    string_contains_to_loader).
+
+    Returns:
+        dict: profiling_indexes and attack_indexes to pass to load_data
+    """
+    (profiling, attack) = data
+    n_profiling, n_attack = len(profiling[0]), len(attack[0])
+
+    if file_format == "chipwhisperer":
+        Path(path).mkdir(parents=True, exist_ok=True)
+        for name, profiling_array, attack_array in zip(("traces", "plain", "key"),
+                                                       profiling, attack):
+            np.save(Path(path)/f"{name}.npy", np.concatenate([profiling_array, attack_array]))
+
+        return {
+            "profiling_indexes": slice(0, n_profiling),
+            "attack_indexes": slice(n_profiling, n_profiling + n_attack),
+        }
+
+    if file_format == "ascad":
+        metadata_type = np.dtype([("plaintext", np.uint8, (16,)), ("key", np.uint8, (16,))])
+        with h5py.File(str(path)+".h5", "w") as file:
+            for group_name, (traces, plaintext, key) in (("Profiling_traces", profiling),
+                                                         ("Attack_traces", attack)):
+                group = file.create_group(group_name)
+                group["traces"] = traces
+                metadata = np.empty(len(traces), dtype=metadata_type)
+                metadata["plaintext"] = plaintext
+                metadata["key"] = key
+                group["metadata"] = metadata
+
+        return {
+            "profiling_indexes": slice(0, n_profiling),
+            "attack_indexes": slice(0, n_attack),
+        }
+
+    raise ValueError(f"Unknown file format {file_format}, use chipwhisperer or ascad")
@@ -0,0 +1,158 @@
+import warnings
+
+import numpy as np
+from scipy.linalg import eigh
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils import gen_batches
+
+from utils.class_statistics import ClassStatistics
+
+
+def between_class_scatter(statistics):
+    """Scatter matrix of class means around total mean (weighted by class
+    counts)."""
+    deviations = statistics.means - statistics.total_mean()
+    return (statistics.counts[:, np.newaxis] * deviations).T @ deviations
+
+
+def pooled_within_class_scatter(traces, y, statistics):
+    """Sum of scatter matrices of traces around means of their classes
+    (statistics of traces, classes of y must be in statistics)."""
+    y_indexes = np.searchsorted(statistics.classes, np.asarray(y))
+    centered = np.asarray(traces, dtype=np.float64) - statistics.means[y_indexes]
+    return centered.T @ centered
+
+
+def shrink(scatter, shrinkage=None):
+    """Scatter matrix shrunk towards scaled identity if shrinkage (0...1)
+    is given."""
+    if not shrinkage:
+        return scatter
+    n_features = scatter.shape[0]
+    return (
+        (1 - shrinkage) * scatter
+        + shrinkage * np.trace(scatter) / n_features * np.eye(n_features)
+    )
+
+
+class FisherDiscriminantReducer(TransformerMixin, BaseEstimator):
+    """Projection of traces to n_components directions that separate
+    output classes (y), computed in closed form from class statistics.
+
+    Traces are scanned once (in batches of batch_size traces, or chunk by
+    chunk with partial_fit), so fit is linear in number of traces and
+    precomputed statistics can be used with fit_statistics. Only pooled
+    within class scatter matrix is kept (not one for every class), so
+    memory does not grow with number of classes.
+
+    With solver "eigen" directions are Fisher discriminants (generalized
+    eigenvectors of between and within class scatter, same subspace as
+    sklearn LinearDiscriminantAnalysis(solver="eigen")), with solver
+    "class_means" they are principal directions of class means (within
+    class scatter is not used). There are at most n_classes - 1 such
+    directions, so n_components_ can be smaller than n_components.
+
+    Args:
+        n_components (int): number of directions
+        solver (str): "eigen" or "class_means"
+        shrinkage (float): shrinkage (0...1) of within class scatter
+            towards scaled identity, needed if it is singular (e.g. more
+            features than traces of a class)
+        batch_size (int): traces converted to float at once by fit (all
+            if None)
+    """
+
+    def __init__(self, n_components=10, solver="eigen", shrinkage=None, batch_size=None):
+        self.n_components = n_components
+        self.solver = solver
+        self.shrinkage = shrinkage
+        self.batch_size = batch_size
+
+    def fit(self, traces, y):
+        self.statistics_ = None
+        y = np.asarray(y)
+        for batch in gen_batches(len(traces), self.batch_size or len(traces)):
+            self._update(traces[batch], y[batch])
+        return self._fit_projection()
+
+    def partial_fit(self, traces, y):
+        """Adds chunk of traces to statistics and refits projection."""
+        if not hasattr(self, "statistics_"):
+            self.statistics_ = None
+        self._update(traces, np.asarray(y))
+        return self._fit_projection()
+
+    def fit_statistics(self, statistics):
+        """Fits projection from precomputed class statistics of traces
+        (with full scatter matrices)."""
+        if not statistics.full_scatter:
+            raise ValueError(
+                "FisherDiscriminantReducer needs statistics with full scatter matrices")
+        self.statistics_ = statistics
+        self.within_scatter_ = statistics.scatters.sum(axis=0)
+        return self._fit_projection()
+
+    def _update(self, traces, y):
+        chunk = ClassStatistics(full_scatter=False).update(traces, y)
+        within_scatter = pooled_within_class_scatter(traces, y, chunk)
+
+        if self.statistics_ is None:
+            self.statistics_ = chunk
+            self.within_scatter_ = within_scatter
+            return
+
+        # scatter of merged classes grows by deviation of their means
+        # (same as ClassStatistics merge, summed over classes)
+        statistics = self.statistics_
+        known = np.isin(chunk.classes, statistics.classes)
+        indexes = np.searchsorted(statistics.classes, chunk.classes[known])
+        count_a = statistics.counts[indexes].astype(np.float64)
+        count_b = chunk.counts[known].astype(np.float64)
+        delta = chunk.means[known] - statistics.means[indexes]
+        weight = count_a * count_b / (count_a + count_b)
+
+        self.within_scatter_ += within_scatter + (weight[:, np.newaxis] * delta).T @ delta
+        statistics.merge(chunk)
+
+    def _fit_projection(self):
+        statistics = self.statistics_
+        n_components = min(
+            self.n_components, len(statistics.classes) - 1, statistics.n_features)
+        if n_components < self.n_components:
+            warnings.warn(
+                f"n_components={self.n_components} is capped at {n_components} "
+                f"({len(statistics.classes)} classes, {statistics.n_features} features)")
+
+        if self.solver == "eigen":
+            # largest generalized eigenvalues, eigenvectors are normalized
+            # so within class scatter of projected traces is identity,
+            # they are scaled to make within class covariance identity
+            n_features = statistics.n_features
+            eigenvalues, eigenvectors = eigh(
+                between_class_scatter(statistics),
+                shrink(self.within_scatter_, self.shrinkage),
+                subset_by_index=[n_features - n_components, n_features - 1]
+            )
+            components = eigenvectors[:, ::-1].T * np.sqrt(
+                statistics.n_samples - len(statistics.classes))
+            explained = eigenvalues[::-1]
+        elif self.solver == "class_means":
+            deviations = statistics.means - statistics.total_mean()
+            _, singular_values, vt = np.linalg.svd(
+                np.sqrt(statistics.counts)[:, np.newaxis] * deviations, full_matrices=False)
+            components = vt[:n_components]
+            explained = singular_values[:n_components]**2
+        else:
+            raise ValueError(
+                f"Unknown solver '{self.solver}', supported are eigen and class_means")
+
+        self.classes_ = statistics.classes
+        self.mean_ = statistics.total_mean()
+        self.components_ = components
+        self.explained_variance_ = explained
+        self.n_components_ = n_components
+
+        return self
+
+    def transform(self, traces, y=None):
+        return (traces - self.mean_) @ self.components_.T
@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+
+from utils.aes import LeakageModel
+from utils.parameters import generate_params_grid
+from utils.reducers import CLASS_LIMITED_REDUCERS, REDUCERS
+
+# values of optional entries of spec
+SPEC_DEFAULTS = {
+    "data_root": "data",
+    "data_cache_dir": None,
+    "target_bytes": [0],
+    "data_slices": {},
+    "ge_n_experiments": 100,
+    "param_sets": {},
+}
+
+
+def _json_key(key):
+    # keys of value dicts are parameter values, JSON allows only strings
+    # (e.g. "10" is number 10)
+    try:
+        return json.loads(key)
+    except json.JSONDecodeError:
+        return key
+
+
+def _parse_values(values):
+    if isinstance(values, dict):
+        return {_json_key(value): _parse_params(sub_dict) for value, sub_dict in values.items()}
+    return values
+
+
+def _parse_params(params):
+    return {name: _parse_values(values) for name, values in params.items()}
+
+
+def load_spec(path):
+    """Experiments described by JSON spec file.
+
+    Spec contains datasets, target_bytes, leakage_models (names of
+    LeakageModel), data_root, data_cache_dir, data_slices (loader
+    arguments, lists [start, stop] are slices), ge_n_experiments and
+    reducers. Every reducer (name from utils.reducers.REDUCERS) has
+    parameters in format of utils.parameters.generate_params_grid (or
+    name of parameters in param_sets), every point of the grid is one
+    experiment and its "grid" parameter (if any) is parameter grid of
+    grid search.
+
+    Example:
+        "reducers": {
+            "pca": {"n_components": [10, 25]},
+            "isomap": {"n_components": {
+                "10": {"grid": [{"n_neighbors": [20, 50]}]},
+                "25": {"grid": [{"n_neighbors": [50, 125]}]}
+            }}
+        }
+    """
+    spec = {**SPEC_DEFAULTS, **json.loads(Path(path).read_text())}
+
+    spec["leakage_models"] = [LeakageModel[name] for name in spec["leakage_models"]]
+    spec["data_slices"] = {
+        name: slice(*value) if isinstance(value, list) else value
+        for name, value in spec["data_slices"].items()
+    }
+
+    reducers = {}
+    for name, params in spec["reducers"].items():
+        if name not in REDUCERS:
+            raise ValueError(f"Unknown reducer {name}, available are {', '.join(REDUCERS)}")
+        if isinstance(params, str):
+            params = spec["param_sets"][params]
+        reducers[name] = _parse_params(params)
+    spec["reducers"] = reducers
+
+    return spec
+
+
+def reducer_configurations(spec, n_classes=None):
+    """All reducers of spec.
+
+    If n_classes (number of output classes of leakage model) is given,
+    n_components of reducers in CLASS_LIMITED_REDUCERS is capped at
+    n_classes - 1 and configurations that become the same are yielded
+    only once.
+
+    Yields:
+        (str, str, dict, dict): name of experiment (reducer and its
+            n_components, e.g. isomap_10), reducer, its parameters and
+            parameter grid of grid search (None if no grid search)
+    """
+    yielded = set()
+    for reducer, params in spec["reducers"].items():
+        for point in generate_params_grid(params):
+            grid = point.pop("grid", None)
+            if n_classes is not None and reducer in CLASS_LIMITED_REDUCERS:
+                point["n_components"] = min(point["n_components"], n_classes - 1)
+
+            configuration = (reducer, repr(sorted(point.items())), repr(grid))
+            if configuration in yielded:
+                continue
+            yielded.add(configuration)
+
+            yield f"{reducer}_{point['n_components']}", reducer, point, grid
+
+
+def configuration_n_neighbors(params, grid=None):
+    """The largest n_neighbors of reducer parameters and its grid (None if
+    reducer doesn't use neighbors)."""
+    n_neighbors = [params.get("n_neighbors")] + list((grid or {}).get("n_neighbors", []))
+    return max((value for value in n_neighbors if value is not None), default=None)
+
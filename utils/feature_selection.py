@@ -1,8 +1,130 @@
-from itertools import combinations
-
 import numpy as np
+from scipy import stats
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from utils.class_statistics import ClassStatistics, sort_by_class
+
+
+def class_means(traces, y_indexes, n_classes):
+    """Means of traces for every class index in y_indexes (0...n_classes-1)."""
+    # sum traces of every class (sort by class and reduce contiguous blocks)
+    sorted_traces, counts, starts = sort_by_class(traces, y_indexes, n_classes)
+    sums = np.add.reduceat(sorted_traces, starts, axis=0, dtype=np.float64)
+
+    return sums / counts[:, np.newaxis]
+
+
+def sum_of_pairwise_differences(means):
+    """Sum of absolute differences of all pairs of rows, for every column.
+
+    If values in column are sorted, k-th smallest value is greater than
+    k values and smaller than C - k - 1 values, so the sum equals
+    sum_k (2k - C + 1) * value_k.
+    """
+    n_classes = len(means)
+    weights = 2 * np.arange(n_classes) - n_classes + 1
+
+    return weights @ np.sort(means, axis=0)
+
+
+def select_spaced_features(scores, n_components, feature_spacing):
+    """Greedy selection of features with largest scores, ignoring
+    neighbourhood of feature_spacing around every selected feature."""
+    Nf = len(scores)
+
+    # visit features from best to worst (ties in original order)
+    order = np.argsort(-scores, kind="stable")
+    ignored = np.zeros(Nf, dtype=bool)
+    ignored[np.isnan(scores)] = True
+
+    features = []
+    for feature_i in order:
+        if len(features) == n_components:
+            break
+        if ignored[feature_i]:
+            continue
+
+        features.append(feature_i)
+
+        # ignore neighbourhood around selected feature
+        ignore_start = max(feature_i - feature_spacing, 0)
+        ignore_end = min(feature_i + feature_spacing + 1, Nf)
+        ignored[ignore_start:ignore_end] = True
+
+    return features
+
+
+def f_regression_from_statistics(statistics):
+    """Univariate linear regression test between every feature and output
+    class (same as sklearn f_regression with y = output classes), computed
+    from class statistics.
+
+    Returns:
+        (np.ndarray, np.ndarray): F-statistics and p-values of features
+    """
+    n_samples = statistics.n_samples
+    counts = statistics.counts
+    y_values = statistics.classes.astype(np.float64)
+
+    # deviations of class values and class means from total means
+    y_deviations = y_values - counts @ y_values / n_samples
+    mean_deviations = statistics.means - statistics.total_mean()
+
+    # within class deviations don't correlate with y (y is constant in class)
+    cross_scatter = (counts * y_deviations) @ mean_deviations
+    x_scatter = statistics.total_scatter_diagonal()
+    y_scatter = counts @ y_deviations**2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cross_scatter / np.sqrt(x_scatter * y_scatter)
+        f_statistic = corr**2 / (1 - corr**2) * (n_samples - 2)
+
+    p_values = stats.f.sf(f_statistic, 1, n_samples - 2)
+
+    return f_statistic, p_values
+
+
+class StatisticsFeatureSelector(TransformerMixin, BaseEstimator):
+    """Removes constant features and selects k features with highest
+    f_regression score (same as Pipeline of VarianceThreshold() and
+    SelectKBest(f_regression, k)), computed from class statistics.
+
+    If fold_statistics (utils.class_statistics.FoldStatistics) is given
+    and traces passed to fit are one of its training folds, precomputed
+    statistics are used instead of scanning traces.
+    """
+
+    def __init__(self, k=300, fold_statistics=None):
+        self.k = k
+        self.fold_statistics = fold_statistics
+        self.features = None
+
+    def fit(self, traces, y):
+        statistics = None
+        if self.fold_statistics is not None:
+            statistics = self.fold_statistics.lookup(traces, y)
+
+        if statistics is None:
+            statistics = ClassStatistics(full_scatter=False).update(traces, y)
+
+        return self.fit_statistics(statistics)
+
+    def fit_statistics(self, statistics):
+        non_constant = np.flatnonzero(~statistics.is_constant())
+
+        scores, _ = f_regression_from_statistics(
+            statistics.select_features(non_constant))
+        scores = np.where(np.isnan(scores), np.finfo(scores.dtype).min, scores)
+
+        # k best features in their original order
+        best = np.argsort(scores, kind="mergesort")[-self.k:]
+        self.features = np.sort(non_constant[best])
+
+        return self
+
+    def transform(self, traces, y=None):
+        return traces[:, self.features]
+
 
 class SumOfDifferenceFeatureSelector(TransformerMixin, BaseEstimator):
 
@@ -13,32 +135,24 @@ class SumOfDifferenceFeatureSelector(TransformerMixin, BaseEstimator):
         self.classes = None
 
     def fit(self, traces, y):
-        self.classes = np.unique(y)
+        self.classes, y_indexes = np.unique(y, return_inverse=True)
+
+        # calculate mean of every group in single pass
+        means = class_means(traces, y_indexes, len(self.classes))
 
-        trace_len = traces.shape[1]
+        return self._select_features(means)
 
-        # calculate mean of every group
-        means = [
-            np.average(traces[y == y_i], axis=0)
-            for y_i in self.classes
-        ]
+    def fit_statistics(self, statistics):
+        self.classes = statistics.classes
+        return self._select_features(statistics.means)
 
+    def _select_features(self, means):
         # calculate sum of pairwise absolute differences of means
-        sumDiffs = np.zeros(trace_len)
-        for p_i, p_j in combinations(means, 2):
-            sumDiffs += np.abs(p_i - p_j)
+        sumDiffs = sum_of_pairwise_differences(means)
 
         # select POIs
-        Nf = len(sumDiffs)
-        for _ in range(self.n_components):
-            # select best feature (largest diff)
-            feature_i = np.nanargmax(sumDiffs)
-            self.features.append(feature_i)
-
-            # ignore neighbourhood around selected feature
-            ignore_start = max(feature_i - self.feature_spacing, 0)
-            ignore_end = min(feature_i + self.feature_spacing + 1, Nf)
-            sumDiffs[ignore_start:ignore_end] = np.nan
+        self.features = select_spaced_features(
+            sumDiffs, self.n_components, self.feature_spacing)
 
         return self
 
@@ -0,0 +1,133 @@
+import heapq
+
+import numpy as np
+from scipy.special import logsumexp
+
+from utils.aes import aes_encrypt
+
+
+def _log_probas(scores):
+    # normalize log likelihoods of every byte to log probabilities
+    scores = np.asarray(scores, dtype=np.float64)
+    return scores - logsumexp(scores, axis=1, keepdims=True)
+
+
+def estimate_rank(scores, key, n_bins=2048):
+    """Estimates rank of full key from per byte scores with histogram
+    convolution (Glowacz et al., "Simpler and More Efficient Rank
+    Estimation for Side-Channel Security Assessment").
+
+    Log probabilities of every byte are put into histogram with common
+    bin width, histogram of full key scores is convolution of byte
+    histograms. Rank is number of keys in bins above bin of correct key,
+    every byte adds at most one bin of rounding error to bounds.
+
+    Args:
+        scores: log likelihoods of key guesses, shape (n_bytes, 256)
+            (e.g. TemplateAttack.logpdfs summed over traces for every byte)
+        key: correct key bytes, shape (n_bytes,)
+        n_bins (int): number of histogram bins for every byte
+
+    Returns:
+        (float, float, float): lower bound, estimate and upper bound of
+            full key rank (0 is best)
+    """
+    log_probas = _log_probas(scores)
+    n_bytes = len(log_probas)
+
+    minimums = log_probas.min(axis=1)
+    bin_width = np.max(log_probas.max(axis=1) - minimums) / (n_bins - 1)
+    if bin_width == 0:
+        bin_width = 1
+
+    bins = np.floor((log_probas - minimums[:, np.newaxis]) / bin_width).astype(int)
+    key_bin = bins[np.arange(n_bytes), key].sum()
+
+    # histogram of sum of scores over all bytes
+    histogram = np.ones(1)
+    for byte_bins in bins:
+        histogram = np.convolve(histogram, np.bincount(byte_bins, minlength=n_bins))
+
+    rank_lower = histogram[min(key_bin + n_bytes, len(histogram)):].sum()
+    rank_upper = max(histogram[max(key_bin - n_bytes + 1, 0):].sum() - 1, 0)
+    # half of other keys in bin of correct key (correct key is not counted)
+    rank_estimate = histogram[key_bin + 1:].sum() + (histogram[key_bin] - 1) / 2
+    rank_estimate = min(max(rank_estimate, rank_lower), rank_upper)
+
+    return rank_lower, rank_estimate, rank_upper
+
+
+def enumerate_keys(scores, max_candidates=2**16, batch_size=4096):
+    """Enumerates full keys from best to worst by sum of per byte scores.
+
+    Keys are enumerated best first with a heap over positions in per byte
+    candidate lists sorted by score. Every position has exactly one parent
+    (decrement at its last nonzero position), so no key is visited twice.
+
+    Args:
+        scores: log likelihoods of key guesses, shape (n_bytes, 256)
+        max_candidates (int): number of enumerated keys
+        batch_size (int): number of keys yielded at once
+
+    Yields:
+        np.ndarray: batches of keys with shape (<=batch_size, n_bytes)
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n_bytes = len(scores)
+
+    # candidates of every byte sorted from best to worst
+    order = np.argsort(-scores, axis=1, kind="stable")
+    sorted_scores = np.take_along_axis(scores, order, axis=1)
+
+    start = (0,) * n_bytes
+    heap = [(-sorted_scores[:, 0].sum(), start, 0)]
+
+    batch = []
+    n_candidates = 0
+    while heap and n_candidates < max_candidates:
+        negative_score, position, last = heapq.heappop(heap)
+
+        batch.append(position)
+        n_candidates += 1
+        if len(batch) == batch_size:
+            yield order[np.arange(n_bytes), np.array(batch)]
+            batch = []
+
+        # children increment candidate index at or after last incremented byte
+        for byte_index in range(last, n_bytes):
+            candidate_index = position[byte_index] + 1
+            if candidate_index == scores.shape[1]:
+                continue
+
+            child = position[:byte_index] + (candidate_index,) + position[byte_index+1:]
+            child_score = (
+                -negative_score
+                - sorted_scores[byte_index, candidate_index - 1]
+                + sorted_scores[byte_index, candidate_index]
+            )
+            heapq.heappush(heap, (-child_score, child, byte_index))
+
+    if batch:
+        yield order[np.arange(n_bytes), np.array(batch)]
+
+
+def find_key(scores, plaintext, ciphertext, max_candidates=2**16, batch_size=4096):
+    """Searches for full AES-128 key among best max_candidates keys,
+    candidates are verified against known plaintext/ciphertext pair.
+
+    Returns:
+        (np.ndarray, int): key and its rank, or (None, number of tested
+            keys) if key was not found
+    """
+    ciphertext = np.asarray(ciphertext, dtype=np.uint8)
+
+    n_tested = 0
+    for keys in enumerate_keys(scores, max_candidates, batch_size):
+        matches = np.all(aes_encrypt(plaintext, keys) == ciphertext, axis=1)
+        if np.any(matches):
+            index = np.argmax(matches)
+            return keys[index].astype(np.uint8), n_tested + index
+
+        n_tested += len(keys)
+
+    return None, n_tested
@@ -0,0 +1,579 @@
+import numpy as np
+from scipy.linalg import eigh, qr, svd
+from scipy.sparse import csr_matrix, eye
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import eigsh
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.manifold import Isomap
+from sklearn.neighbors import NearestNeighbors
+from sklearn.utils import check_array, check_random_state, gen_batches
+from sklearn.utils.validation import check_is_fitted
+
+# number of elements of temporary arrays used by out of sample transforms
+TRANSFORM_BATCH_ELEMENTS = 2**24
+# geodesic distances of new traces are computed in batches that fit in cache
+GEODESIC_BATCH_ELEMENTS = 2**16
+
+
+def _batches(n_samples, elements_per_sample, batch_elements=TRANSFORM_BATCH_ELEMENTS):
+    batch_size = max(1, batch_elements // max(elements_per_sample, 1))
+    return gen_batches(n_samples, batch_size)
+
+
+def barycenter_weights(X, Y, indexes, reg=1e-3):
+    """Weights that reconstruct every trace of X from its neighbors in Y
+    (same as weights of LLE), all systems are solved at once.
+
+    Args:
+        X: traces, shape (n_samples, n_features)
+        Y: training traces, shape (n_training_samples, n_features)
+        indexes: indexes of neighbors in Y, shape (n_samples, n_neighbors)
+        reg (float): regularization relative to trace of local Gram matrix
+
+    Returns:
+        np.ndarray: weights with shape (n_samples, n_neighbors)
+    """
+    n_neighbors = indexes.shape[1]
+
+    # local Gram matrices of neighbors centered at traces
+    Z = Y[indexes] - X[:, np.newaxis, :]
+    G = Z @ np.transpose(Z, (0, 2, 1))
+
+    trace = np.trace(G, axis1=1, axis2=2)
+    R = np.where(trace > 0, reg * trace, reg)
+    G[:, np.arange(n_neighbors), np.arange(n_neighbors)] += R[:, np.newaxis]
+
+    weights = np.linalg.solve(G, np.ones((len(X), n_neighbors, 1)))[:, :, 0]
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def reconstruct_embedding(X, kneighbors, training_traces, embedding, n_neighbors, reg=1e-3):
+    """Out of sample embedding of traces X as barycentric combination of
+    embedding of their n_neighbors nearest training traces.
+
+    Cost depends only on number of traces in X and n_neighbors (neighbors
+    are found by prebuilt index), not on number of training traces.
+
+    Args:
+        kneighbors: function (X, n_neighbors) -> (distances, indexes) of
+            nearest training traces, e.g. NearestNeighbors.kneighbors
+    """
+    X = np.asarray(X, dtype=np.float64)
+    X_new = np.empty((len(X), embedding.shape[1]))
+
+    for batch in _batches(len(X), n_neighbors * max(X.shape[1], n_neighbors)):
+        _, indexes = kneighbors(X[batch], n_neighbors)
+        weights = barycenter_weights(X[batch], training_traces, indexes, reg)
+        X_new[batch] = np.einsum("nk,nkc->nc", weights, embedding[indexes])
+
+    return X_new
+
+
+def _null_space(M, k, k_skip=1, eigen_solver="arpack", tol=1e-6, max_iter=100,
+                random_state=None):
+    # eigenvectors of k smallest eigenvalues of M (after k_skip smallest),
+    # same as sklearn.manifold.locally_linear_embedding
+    if eigen_solver == "auto":
+        if M.shape[0] > 200 and k + k_skip < 10:
+            eigen_solver = "arpack"
+        else:
+            eigen_solver = "dense"
+
+    if eigen_solver == "arpack":
+        v0 = check_random_state(random_state).uniform(-1, 1, M.shape[0])
+        try:
+            eigen_values, eigen_vectors = eigsh(
+                M, k + k_skip, sigma=0.0, tol=tol, maxiter=max_iter, v0=v0)
+        except RuntimeError as e:
+            raise ValueError(
+                f"Error in determining null-space with ARPACK. Error message: '{e}'. "
+                "Note that eigen_solver='arpack' can fail when the weight matrix is "
+                "singular or otherwise ill-behaved. In that case, eigen_solver='dense' "
+                "is recommended."
+            ) from e
+        return eigen_vectors[:, k_skip:], np.sum(eigen_values[k_skip:])
+
+    if eigen_solver == "dense":
+        if hasattr(M, "toarray"):
+            M = M.toarray()
+        eigen_values, eigen_vectors = eigh(
+            M, subset_by_index=(k_skip, k + k_skip - 1), overwrite_a=True)
+        index = np.argsort(np.abs(eigen_values))
+        return eigen_vectors[:, index], np.sum(eigen_values)
+
+    raise ValueError(f"Unrecognized eigen_solver '{eigen_solver}'")
+
+
+def _standard_weights(X, neighbors, reg):
+    n_samples, n_neighbors = neighbors.shape
+    weights = np.empty((n_samples, n_neighbors))
+    for batch in _batches(n_samples, n_neighbors * max(X.shape[1], n_neighbors)):
+        weights[batch] = barycenter_weights(X[batch], X, neighbors[batch], reg)
+
+    W = csr_matrix(
+        (weights.ravel(), neighbors.ravel(), np.arange(0, n_samples * n_neighbors + 1, n_neighbors)),
+        shape=(n_samples, n_samples))
+    return W
+
+
+def _local_basis(Xi, use_svd):
+    # left singular vectors of centered neighborhood, largest first
+    if use_svd:
+        return svd(Xi, full_matrices=True)[0]
+    return eigh(Xi @ Xi.T)[1][:, ::-1]
+
+
+def _hessian_matrix(X, neighbors, n_components, hessian_tol):
+    n_samples, n_neighbors = neighbors.shape
+    dp = n_components * (n_components + 1) // 2
+    if n_neighbors <= n_components + dp:
+        raise ValueError(
+            "for method='hessian', n_neighbors must be greater than "
+            "[n_components * (n_components + 3) / 2]")
+
+    Yi = np.empty((n_neighbors, 1 + n_components + dp))
+    Yi[:, 0] = 1
+    M = np.zeros((n_samples, n_samples))
+    use_svd = n_neighbors > X.shape[1]
+
+    for i in range(n_samples):
+        Gi = X[neighbors[i]]
+        Gi -= Gi.mean(axis=0)
+        U = _local_basis(Gi, use_svd)
+
+        # products of local coordinates estimate Hessian
+        Yi[:, 1:1 + n_components] = U[:, :n_components]
+        j = 1 + n_components
+        for k in range(n_components):
+            Yi[:, j:j + n_components - k] = U[:, k:k + 1] * U[:, k:n_components]
+            j += n_components - k
+
+        Q, _ = qr(Yi)
+        w = Q[:, n_components + 1:]
+        S = w.sum(axis=0)
+        S[np.abs(S) < hessian_tol] = 1
+        w /= S
+
+        M[np.ix_(neighbors[i], neighbors[i])] += w @ w.T
+
+    return M
+
+
+def _modified_matrix(X, neighbors, n_components, modified_tol):
+    n_samples, n_neighbors = neighbors.shape
+    if n_neighbors < n_components:
+        raise ValueError("modified LLE requires n_neighbors >= n_components")
+
+    # eigenvectors (columns, largest first) and eigenvalues of local
+    # covariance matrices
+    n_eigenvalues = min(X.shape[1], n_neighbors)
+    V = np.zeros((n_samples, n_neighbors, n_neighbors))
+    eigenvalues = np.zeros((n_samples, n_eigenvalues))
+    if n_neighbors > X.shape[1]:
+        for i in range(n_samples):
+            V[i], eigenvalues[i], _ = svd(X[neighbors[i]] - X[i], full_matrices=True)
+        eigenvalues **= 2
+    else:
+        for i in range(n_samples):
+            X_neighbors = X[neighbors[i]] - X[i]
+            values, vectors = eigh(X_neighbors @ X_neighbors.T)
+            eigenvalues[i] = values[::-1]
+            V[i] = vectors[:, ::-1]
+
+    # regularized LLE weights from eigendecomposition
+    reg = 1e-3 * eigenvalues.sum(axis=1)
+    tmp = np.transpose(V, (0, 2, 1)) @ np.ones(n_neighbors)
+    tmp[:, :n_eigenvalues] /= eigenvalues + reg[:, np.newaxis]
+    tmp[:, n_eigenvalues:] /= reg[:, np.newaxis]
+    w_reg = np.einsum("nij,nj->ni", V, tmp)
+    w_reg /= w_reg.sum(axis=1)[:, np.newaxis]
+
+    # size of "almost null space" of every trace
+    rho = eigenvalues[:, n_components:].sum(axis=1) / eigenvalues[:, :n_components].sum(axis=1)
+    eta = np.median(rho)
+    eigenvalues_cumsum = np.cumsum(eigenvalues, axis=1)
+    eta_range = eigenvalues_cumsum[:, -1:] / eigenvalues_cumsum[:, :-1] - 1
+    s_range = np.array([np.searchsorted(row[::-1], eta) for row in eta_range], dtype=int)
+    s_range += n_neighbors - n_eigenvalues
+
+    M = np.zeros((n_samples, n_samples))
+    for i in range(n_samples):
+        s_i = s_range[i]
+        Vi = V[i, :, n_neighbors - s_i:]
+        alpha_i = np.linalg.norm(Vi.sum(axis=0)) / np.sqrt(s_i)
+
+        # Householder reflection that maps Vi.T @ ones to alpha_i * ones
+        h = np.full(s_i, alpha_i) - Vi.T @ np.ones(n_neighbors)
+        norm_h = np.linalg.norm(h)
+        h = h * 0 if norm_h < modified_tol else h / norm_h
+
+        Wi = Vi - 2 * np.outer(Vi @ h, h) + (1 - alpha_i) * w_reg[i, :, np.newaxis]
+
+        M[np.ix_(neighbors[i], neighbors[i])] += Wi @ Wi.T
+        Wi_sum = Wi.sum(axis=1)
+        M[i, neighbors[i]] -= Wi_sum
+        M[neighbors[i], i] -= Wi_sum
+        M[i, i] += s_i
+
+    return M
+
+
+def _ltsa_matrix(X, neighbors, n_components):
+    n_samples, n_neighbors = neighbors.shape
+    M = np.zeros((n_samples, n_samples))
+    use_svd = n_neighbors > X.shape[1]
+
+    for i in range(n_samples):
+        Xi = X[neighbors[i]]
+        Xi -= Xi.mean(axis=0)
+        v = _local_basis(Xi, use_svd)
+
+        Gi = np.zeros((n_neighbors, n_components + 1))
+        Gi[:, 1:] = v[:, :n_components]
+        Gi[:, 0] = 1.0 / np.sqrt(n_neighbors)
+
+        M[np.ix_(neighbors[i], neighbors[i])] -= Gi @ Gi.T
+        M[neighbors[i], neighbors[i]] += 1
+
+    return M
+
+
+def locally_linear_embedding_from_neighbors(
+        X, neighbors, n_components, reg=1e-3, eigen_solver="auto", tol=1e-6, max_iter=100,
+        method="standard", hessian_tol=1e-4, modified_tol=1e-12, random_state=None):
+    """Locally linear embedding of traces X with precomputed neighbors.
+
+    Same algorithms (standard, hessian, modified, ltsa) and results as
+    sklearn.manifold.locally_linear_embedding, which always searches
+    neighbors itself.
+
+    Args:
+        neighbors: indexes of nearest neighbors of every trace (trace
+            itself excluded), shape (n_samples, n_neighbors)
+        others: see sklearn.manifold.locally_linear_embedding
+
+    Returns:
+        (np.ndarray, float): embedding and reconstruction error
+    """
+    n_samples, n_neighbors = neighbors.shape
+    if n_components > X.shape[1]:
+        raise ValueError("output dimension must be less than or equal to input dimension")
+    if n_neighbors >= n_samples:
+        raise ValueError(
+            f"Expected n_neighbors < n_samples, but n_samples = {n_samples}, "
+            f"n_neighbors = {n_neighbors}")
+
+    M_sparse = eigen_solver != "dense"
+
+    if method == "standard":
+        W = _standard_weights(X, neighbors, reg)
+        # M = (I - W)' (I - W)
+        if M_sparse:
+            M = eye(*W.shape, format=W.format) - W
+            M = (M.T @ M).tocsr()
+        else:
+            M = (W.T @ W - W.T - W).toarray()
+            M.flat[::M.shape[0] + 1] += 1
+    elif method == "hessian":
+        M = _hessian_matrix(X, neighbors, n_components, hessian_tol)
+    elif method == "modified":
+        M = _modified_matrix(X, neighbors, n_components, modified_tol)
+    elif method == "ltsa":
+        M = _ltsa_matrix(X, neighbors, n_components)
+    else:
+        raise ValueError(f"Unrecognized method '{method}'")
+
+    if M_sparse and method != "standard" and method != "ltsa":
+        M = csr_matrix(M)
+
+    return _null_space(M, n_components, k_skip=1, eigen_solver=eigen_solver, tol=tol,
+                       max_iter=max_iter, random_state=random_state)
+
+
+def _uses_euclidean_neighbors(reducer):
+    return (
+        reducer.neighbors_graph is not None
+        and reducer.metric == "minkowski"
+        and reducer.p == 2
+        and reducer.metric_params is None
+    )
+
+
+class SharedNeighborsIsomap(TransformerMixin, BaseEstimator):
+    """Isomap that takes nearest neighbors of training traces from
+    NeighborsGraph shared by all reducers (see utils.neighbors).
+
+    Shared neighbors are passed to sklearn Isomap as precomputed sparse
+    neighbors graph (metric="precomputed"). Without neighbors_graph,
+    with other than euclidean metric, or if neighbors graph is
+    disconnected (Isomap completes it from traces), Isomap searches
+    neighbors itself.
+
+    New traces are transformed in batches. If transform_n_neighbors is
+    given, they are embedded as barycentric combination of embedding of
+    their nearest training traces instead of projecting their geodesic
+    distances to all training traces (faster, approximate).
+
+    Args:
+        neighbors_graph (NeighborsGraph): shared neighbors graph
+        transform_n_neighbors (int): number of neighbors used to embed new
+            traces, None for exact Isomap transform
+        others: see sklearn.manifold.Isomap
+
+    Attributes:
+        isomap_ (Isomap): fitted Isomap
+        embedding_: embedding of training traces
+    """
+
+    def __init__(self, *, neighbors_graph=None, transform_n_neighbors=None, n_neighbors=5,
+                 n_components=2, eigen_solver="auto", tol=0, max_iter=None,
+                 path_method="auto", neighbors_algorithm="auto", n_jobs=None,
+                 metric="minkowski", p=2, metric_params=None):
+        self.neighbors_graph = neighbors_graph
+        self.transform_n_neighbors = transform_n_neighbors
+        self.n_neighbors = n_neighbors
+        self.n_components = n_components
+        self.eigen_solver = eigen_solver
+        self.tol = tol
+        self.max_iter = max_iter
+        self.path_method = path_method
+        self.neighbors_algorithm = neighbors_algorithm
+        self.n_jobs = n_jobs
+        self.metric = metric
+        self.p = p
+        self.metric_params = metric_params
+
+    def _isomap(self, **params):
+        return Isomap(
+            n_neighbors=self.n_neighbors,
+            n_components=self.n_components,
+            eigen_solver=self.eigen_solver,
+            tol=self.tol,
+            max_iter=self.max_iter,
+            path_method=self.path_method,
+            neighbors_algorithm=self.neighbors_algorithm,
+            n_jobs=self.n_jobs,
+            **params
+        )
+
+    def fit(self, X, y=None):
+        X = check_array(X, dtype=np.float64)
+        self.training_traces_ = X
+
+        self.isomap_ = None
+        if _uses_euclidean_neighbors(self):
+            index = self.neighbors_graph.index(X, self.n_neighbors)
+            graph = index.kneighbors_graph(self.n_neighbors)
+
+            n_connected_components, _ = connected_components(graph)
+            if n_connected_components == 1:
+                self.isomap_ = self._isomap(metric="precomputed").fit(graph)
+                self.neighbors_ = index
+
+        if self.isomap_ is None:
+            self.isomap_ = self._isomap(
+                metric=self.metric, p=self.p, metric_params=self.metric_params).fit(X)
+            self.neighbors_ = self.isomap_.nbrs_
+
+        self.embedding_ = self.isomap_.embedding_
+        return self
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X).embedding_
+
+    def transform(self, X):
+        check_is_fitted(self, "embedding_")
+        X = check_array(X, dtype=np.float64)
+
+        if self.transform_n_neighbors is not None:
+            return reconstruct_embedding(
+                X, self.neighbors_.kneighbors, self.training_traces_, self.embedding_,
+                self.transform_n_neighbors)
+
+        dist_matrix = self.isomap_.dist_matrix_
+        n_samples_fit = len(dist_matrix)
+
+        distances, indexes = self.neighbors_.kneighbors(X, self.n_neighbors)
+
+        # geodesic distance to training traces through nearest neighbors,
+        # minimum over neighbors is updated one neighbor at a time for small
+        # batch of traces, so temporary arrays stay in cache
+        G_X = np.empty((len(X), n_samples_fit))
+        path_lengths = np.empty((1, n_samples_fit))
+        for batch in _batches(len(X), n_samples_fit, GEODESIC_BATCH_ELEMENTS):
+            geodesic = G_X[batch]
+            path_lengths = np.resize(path_lengths, geodesic.shape)
+
+            np.add(dist_matrix[indexes[batch, 0]],
+                   distances[batch, 0, np.newaxis], out=geodesic)
+            for neighbor in range(1, indexes.shape[1]):
+                np.add(dist_matrix[indexes[batch, neighbor]],
+                       distances[batch, neighbor, np.newaxis], out=path_lengths)
+                np.minimum(geodesic, path_lengths, out=geodesic)
+
+        G_X **= 2
+        G_X *= -0.5
+
+        return self.isomap_.kernel_pca_.transform(G_X)
+
+
+class SharedNeighborsLocallyLinearEmbedding(TransformerMixin, BaseEstimator):
+    """LocallyLinearEmbedding (any method) that takes nearest neighbors of
+    training traces from NeighborsGraph shared by all reducers (see
+    locally_linear_embedding_from_neighbors).
+
+    New traces are transformed in batches (reconstruction weights of whole
+    batch are computed at once), see reconstruct_embedding.
+
+    Args:
+        neighbors_graph (NeighborsGraph): shared neighbors graph, if None
+            neighbors are searched with NearestNeighbors
+        transform_n_neighbors (int): number of neighbors used to embed new
+            traces, None to use n_neighbors (same as LocallyLinearEmbedding)
+        others: see sklearn.manifold.LocallyLinearEmbedding
+
+    Attributes:
+        embedding_: embedding of training traces
+        reconstruction_error_ (float): reconstruction error of embedding
+    """
+
+    def __init__(self, *, neighbors_graph=None, transform_n_neighbors=None, n_neighbors=5,
+                 n_components=2, reg=1e-3, eigen_solver="auto", tol=1e-6, max_iter=100,
+                 method="standard", hessian_tol=1e-4, modified_tol=1e-12,
+                 neighbors_algorithm="auto", random_state=None, n_jobs=None):
+        self.neighbors_graph = neighbors_graph
+        self.transform_n_neighbors = transform_n_neighbors
+        self.n_neighbors = n_neighbors
+        self.n_components = n_components
+        self.reg = reg
+        self.eigen_solver = eigen_solver
+        self.tol = tol
+        self.max_iter = max_iter
+        self.method = method
+        self.hessian_tol = hessian_tol
+        self.modified_tol = modified_tol
+        self.neighbors_algorithm = neighbors_algorithm
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+
+    def fit(self, X, y=None):
+        X = check_array(X, dtype=np.float64)
+        self.training_traces_ = X
+
+        # trace itself is the first of its neighbors
+        if self.neighbors_graph is not None:
+            self.neighbors_ = self.neighbors_graph.index(X, self.n_neighbors)
+            _, indexes = self.neighbors_.training_neighbors(self.n_neighbors)
+        else:
+            self.neighbors_ = NearestNeighbors(
+                n_neighbors=self.n_neighbors + 1, algorithm=self.neighbors_algorithm,
+                n_jobs=self.n_jobs).fit(X)
+            indexes = self.neighbors_.kneighbors(X, return_distance=False)
+
+        self.embedding_, self.reconstruction_error_ = locally_linear_embedding_from_neighbors(
+            X, indexes[:, 1:],
+            n_components=self.n_components,
+            reg=self.reg,
+            eigen_solver=self.eigen_solver,
+            tol=self.tol,
+            max_iter=self.max_iter,
+            method=self.method,
+            hessian_tol=self.hessian_tol,
+            modified_tol=self.modified_tol,
+            random_state=check_random_state(self.random_state),
+        )
+        return self
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X).embedding_
+
+    def transform(self, X):
+        check_is_fitted(self, "embedding_")
+        X = check_array(X, dtype=np.float64)
+
+        return reconstruct_embedding(
+            X, self.neighbors_.kneighbors, self.training_traces_, self.embedding_,
+            self.transform_n_neighbors or self.n_neighbors, self.reg)
+
+
+def select_landmarks(n_samples, n_landmarks, random_state=None):
+    """Sorted indexes of n_landmarks randomly selected traces (all traces
+    if n_landmarks is None or larger than n_samples)."""
+    if n_landmarks is None or n_landmarks >= n_samples:
+        return np.arange(n_samples)
+
+    random_state = check_random_state(random_state)
+    return np.sort(random_state.choice(n_samples, n_landmarks, replace=False))
+
+
+class _LandmarkMixin:
+    # reducer is fitted on landmarks only, other traces are embedded by its
+    # out of sample transform (linear in number of traces)
+
+    def fit(self, X, y=None):
+        X = np.asarray(X)
+        self.landmarks_ = select_landmarks(len(X), self.n_landmarks, self.random_state)
+        return super().fit(X[self.landmarks_])
+
+    def fit_transform(self, X, y=None):
+        self.fit(X)
+
+        X_new = self.transform(X)
+        X_new[self.landmarks_] = self.embedding_
+        return X_new
+
+
+class LandmarkIsomap(_LandmarkMixin, SharedNeighborsIsomap):
+    """Landmark Isomap, geodesic distances and embedding are computed for
+    n_landmarks randomly selected traces, other traces are embedded with
+    their geodesic distances to landmarks (as new traces in Isomap).
+
+    Fit is cubic only in n_landmarks and linear in number of traces.
+
+    Args:
+        n_landmarks (int): number of landmarks, None to use all traces
+        random_state: seed of landmark selection (reducers with the same
+            seed use the same landmarks and share their neighbors graph)
+        others: see SharedNeighborsIsomap
+    """
+
+    def __init__(self, *, n_landmarks=1000, random_state=None, neighbors_graph=None,
+                 transform_n_neighbors=None, n_neighbors=5, n_components=2,
+                 eigen_solver="auto", tol=0, max_iter=None, path_method="auto",
+                 neighbors_algorithm="auto", n_jobs=None, metric="minkowski", p=2,
+                 metric_params=None):
+        super().__init__(
+            neighbors_graph=neighbors_graph, transform_n_neighbors=transform_n_neighbors,
+            n_neighbors=n_neighbors, n_components=n_components, eigen_solver=eigen_solver,
+            tol=tol, max_iter=max_iter, path_method=path_method,
+            neighbors_algorithm=neighbors_algorithm, n_jobs=n_jobs, metric=metric, p=p,
+            metric_params=metric_params)
+        self.n_landmarks = n_landmarks
+        self.random_state = random_state
+
+
+class LandmarkLocallyLinearEmbedding(_LandmarkMixin, SharedNeighborsLocallyLinearEmbedding):
+    """LocallyLinearEmbedding (any method) of n_landmarks randomly selected
+    traces, other traces are embedded with reconstruction weights from
+    their nearest landmarks (Nystrom-like extension of LLE/LTSA).
+
+    Fit is cubic only in n_landmarks and linear in number of traces.
+
+    Args:
+        n_landmarks (int): number of landmarks, None to use all traces
+        others: see SharedNeighborsLocallyLinearEmbedding (random_state
+            is also seed of landmark selection)
+    """
+
+    def __init__(self, *, n_landmarks=1000, neighbors_graph=None, transform_n_neighbors=None,
+                 n_neighbors=5, n_components=2, reg=1e-3, eigen_solver="auto", tol=1e-6,
+                 max_iter=100, method="standard", hessian_tol=1e-4, modified_tol=1e-12,
+                 neighbors_algorithm="auto", random_state=None, n_jobs=None):
+        super().__init__(
+            neighbors_graph=neighbors_graph, transform_n_neighbors=transform_n_neighbors,
+            n_neighbors=n_neighbors, n_components=n_components, reg=reg,
+            eigen_solver=eigen_solver, tol=tol, max_iter=max_iter, method=method,
+            hessian_tol=hessian_tol, modified_tol=modified_tol,
+            neighbors_algorithm=neighbors_algorithm, random_state=random_state,
+            n_jobs=n_jobs)
+        self.n_landmarks = n_landmarks
@@ -0,0 +1,117 @@
+import warnings
+
+import numpy as np
+import umap
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.neighbors import NearestNeighbors
+from sklearn.utils import check_array
+from sklearn.utils.validation import check_is_fitted
+
+from utils.manifold import reconstruct_embedding
+
+
+class _UMAPSearchIndex:
+    # NeighborsIndex with query interface of pynndescent.NNDescent, used
+    # by UMAP.transform
+    _angular_trees = False
+
+    def __init__(self, index):
+        self.index = index
+
+    def query(self, X, k=10, epsilon=None):
+        distances, indexes = self.index.kneighbors(X, k)
+        return indexes.astype(np.int32), distances.astype(np.float32)
+
+
+class SharedNeighborsUMAP(TransformerMixin, BaseEstimator):
+    """UMAP that takes nearest neighbors of training traces from
+    NeighborsGraph shared by all reducers (passed to umap.UMAP as
+    precomputed_knn).
+
+    If transform_n_neighbors is given, new traces are embedded as
+    barycentric combination of embedding of their nearest training traces
+    (see utils.manifold.reconstruct_embedding) instead of optimizing their
+    embedding, which is much faster for large attack sets.
+
+    Args:
+        neighbors_graph (NeighborsGraph): if None neighbors are computed
+            as in UMAP
+        transform_n_neighbors (int): number of neighbors used to embed new
+            traces, None for UMAP transform
+        umap_params (dict): other umap.UMAP parameters
+        others: see umap.UMAP
+
+    Attributes:
+        umap_ (umap.UMAP): fitted UMAP
+        embedding_: embedding of training traces
+    """
+
+    def __init__(self, *, neighbors_graph=None, transform_n_neighbors=None, n_neighbors=15,
+                 n_components=2, metric="euclidean", min_dist=0.1, spread=1.0, n_epochs=None,
+                 learning_rate=1.0, init="spectral", random_state=None, low_memory=True,
+                 n_jobs=-1, umap_params=None):
+        self.neighbors_graph = neighbors_graph
+        self.transform_n_neighbors = transform_n_neighbors
+        self.n_neighbors = n_neighbors
+        self.n_components = n_components
+        self.metric = metric
+        self.min_dist = min_dist
+        self.spread = spread
+        self.n_epochs = n_epochs
+        self.learning_rate = learning_rate
+        self.init = init
+        self.random_state = random_state
+        self.low_memory = low_memory
+        self.n_jobs = n_jobs
+        self.umap_params = umap_params
+
+    def _umap(self, **params):
+        return umap.UMAP(
+            n_neighbors=self.n_neighbors,
+            n_components=self.n_components,
+            metric=self.metric,
+            min_dist=self.min_dist,
+            spread=self.spread,
+            n_epochs=self.n_epochs,
+            learning_rate=self.learning_rate,
+            init=self.init,
+            random_state=self.random_state,
+            low_memory=self.low_memory,
+            n_jobs=self.n_jobs,
+            **{**(self.umap_params or {}), **params}
+        )
+
+    def fit(self, X, y=None):
+        X = check_array(X, dtype=np.float64)
+        self.training_traces_ = X
+
+        if self.neighbors_graph is None or self.metric != "euclidean":
+            self.neighbors_ = None
+            self.umap_ = self._umap().fit(X, y)
+        else:
+            # UMAP counts trace itself as one of its neighbors
+            self.neighbors_ = self.neighbors_graph.index(X, self.n_neighbors - 1)
+            distances, indexes = self.neighbors_.training_neighbors(self.n_neighbors - 1)
+            precomputed_knn = (indexes.copy(), distances.copy(), _UMAPSearchIndex(self.neighbors_))
+
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", message=".*knn_search_index.*")
+                self.umap_ = self._umap(precomputed_knn=precomputed_knn).fit(X, y)
+
+        self.embedding_ = self.umap_.embedding_
+        return self
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X, y).embedding_
+
+    def transform(self, X):
+        check_is_fitted(self, "embedding_")
+        if self.transform_n_neighbors is None:
+            return self.umap_.transform(X)
+
+        if self.neighbors_ is None:
+            self.neighbors_ = NearestNeighbors().fit(self.training_traces_)
+
+        return reconstruct_embedding(
+            X, self.neighbors_.kneighbors, self.training_traces_, self.embedding_,
+            self.transform_n_neighbors)
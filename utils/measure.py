@@ -1,51 +1,105 @@
 import numpy as np
+from joblib import Parallel, delayed
 
+from utils.profiling import profile_stage
 
-def make_ge_scoring(number_of_experiments):
+
+def make_ge_scoring(number_of_experiments, random_state=43, n_jobs=None, profiler=None):
 
     def ge_scoring(clf, X, y):
         scores = clf.predict_proba(X)
 
         # compute measures (GE and SR)
-        np.random.seed(43)
-        ge, sr = guessing_entropy_and_success_rate(
-            scores,
-            y[0],
-            number_of_experiments=number_of_experiments)
+        with profile_stage(profiler, "ge"):
+            ge, sr = guessing_entropy_and_success_rate(
+                scores,
+                y[0],
+                number_of_experiments=number_of_experiments,
+                random_state=random_state,
+                n_jobs=n_jobs)
 
         return ge[-1]
 
     return ge_scoring
 
 
-def guessing_entropy_and_success_rate(y_log_proba, secret_key, number_of_experiments=50):
+# upper bound on number of elements of cumulative sums computed at once
+GE_BATCH_ELEMENTS = 2**24
 
-    N, L = y_log_proba.shape
 
-    GE = np.zeros(N)
-    SR = np.zeros(N)
+def _key_ranks(y_log_proba, secret_key, permutations):
+
+    # compute cumulative sum of log_probas (log of cumulative product)
+    # for every experiment (experiment x trace x key guess)
+    cumsum = y_log_proba[permutations].cumsum(axis=1)
+
+    # rank of secret_key is number of other key guesses with larger or
+    # equal score (0 is best), key guesses tied with secret_key are counted
+    # as better (coarse leakage models, e.g. LSB, give many ties)
+    key_cumsum = cumsum[:, :, secret_key, np.newaxis]
+    return np.sum(cumsum >= key_cumsum, axis=2) - 1
+
+
+def _experiment_streams(random_state, number_of_experiments):
+    # independent random stream for every experiment
+    if isinstance(random_state, np.random.Generator):
+        return random_state.spawn(number_of_experiments)
+
+    if not isinstance(random_state, np.random.SeedSequence):
+        random_state = np.random.SeedSequence(random_state)
+
+    return random_state.spawn(number_of_experiments)
 
-    for _ in range(number_of_experiments):
 
-        np.random.shuffle(y_log_proba)
+def _ranks_sums(y_log_proba, secret_key, streams):
+    N, _ = y_log_proba.shape
 
-        # compute cumulative sum of log_probas (log of cumulative product)
-        cumsum = y_log_proba.cumsum(axis=0)
+    # random order of traces for every experiment
+    permutations = np.array([
+        np.random.default_rng(stream).permutation(N)
+        for stream in streams
+    ])
 
-        # argsort to find rank of key guesses (first is worst, last is best)
-        ranked_key_guesses = cumsum.argsort(axis=1)
+    key_rank = _key_ranks(y_log_proba, secret_key, permutations)
+
+    return key_rank.sum(axis=0), (key_rank == 0).sum(axis=0)
+
+
+def guessing_entropy_and_success_rate(y_log_proba, secret_key, number_of_experiments=50,
+                                      batch_size=None, random_state=None, n_jobs=None):
+    """Guessing entropy and success rate of secret_key for increasing number
+    of attack traces, averaged over experiments with random order of traces.
+
+    y_log_proba is not modified. Experiments are processed in batches of
+    batch_size experiments (by default as many as fit in GE_BATCH_ELEMENTS)
+    which are distributed over n_jobs workers (joblib).
+
+    Every experiment draws its order of traces from its own stream spawned
+    from random_state (int, np.random.SeedSequence or np.random.Generator),
+    so results depend only on random_state, not on batch_size or n_jobs.
+
+    Key guesses with the same score as secret_key are ranked before it
+    (pessimistic rank), so ties never count as success.
+
+    Returns:
+        (np.ndarray, np.ndarray): GE and SR for 1...N traces
+    """
+    y_log_proba = np.asarray(y_log_proba)
+    N, L = y_log_proba.shape
 
-        # find key_rank of secret_key
-        key_rank = np.argmax(ranked_key_guesses == secret_key, axis=1)
-        key_rank = L - key_rank - 1  # adjust to reverse order
-        # print(key_rank)
+    if batch_size is None:
+        batch_size = max(GE_BATCH_ELEMENTS // (N * L), 1)
 
-        key_is_best_guess = (key_rank == 0).astype(int)
+    streams = _experiment_streams(random_state, number_of_experiments)
 
-        GE += key_rank
-        SR += key_is_best_guess
+    batches_sums = Parallel(n_jobs=n_jobs)(
+        delayed(_ranks_sums)(
+            y_log_proba, secret_key, streams[batch_start:batch_start+batch_size])
+        for batch_start in range(0, number_of_experiments, batch_size)
+    )
 
-    GE /= number_of_experiments
-    SR /= number_of_experiments
+    # sums of ranks are integers, so they don't depend on order of batches
+    GE = np.sum([ge_sum for ge_sum, _ in batches_sums], axis=0) / number_of_experiments
+    SR = np.sum([sr_sum for _, sr_sum in batches_sums], axis=0) / number_of_experiments
 
     return GE, SR
@@ -0,0 +1,196 @@
+import uuid
+import weakref
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import NearestNeighbors
+
+
+def _self_first(distances, indexes):
+    # every trace is its own nearest neighbor, but with duplicate traces
+    # (or rounding errors) it doesn't have to be in the first column
+    rows = np.arange(len(indexes))
+    is_self = indexes == rows[:, np.newaxis]
+    self_column = np.where(is_self.any(axis=1), is_self.argmax(axis=1), indexes.shape[1] - 1)
+
+    for row in np.flatnonzero(self_column):
+        column = self_column[row]
+        indexes[row, 1:column+1] = indexes[row, :column]
+        distances[row, 1:column+1] = distances[row, :column]
+        indexes[row, 0] = row
+        distances[row, 0] = 0
+
+    return distances, indexes
+
+
+class NeighborsIndex:
+    """Nearest neighbors of training traces precomputed for n_neighbors.
+
+    Neighbors of training traces are available as arrays
+    (training_neighbors) or as sparse neighbors graph that sklearn
+    estimators accept with metric="precomputed" (kneighbors_graph), other
+    traces (e.g. attack traces) are searched by kneighbors with search
+    index built on first use.
+
+    Args:
+        data: training traces, C contiguous float64 array
+        n_neighbors (int): number of precomputed neighbors (trace itself
+            is not counted)
+        algorithm (str): search index of NearestNeighbors ("ball_tree",
+            "kd_tree", "brute" or "auto"; trees are faster only for
+            traces with few features)
+        leaf_size (int): leaf size of tree index
+    """
+
+    def __init__(self, data, n_neighbors, algorithm="auto", leaf_size=40):
+        self.data = data
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self._search_index = None
+
+        # exact neighbors of all traces at once, trace itself is included
+        distances, indexes = NearestNeighbors(algorithm="brute").fit(data).kneighbors(
+            data, n_neighbors + 1)
+        self.distances, self.indexes = _self_first(distances, indexes)
+
+    @property
+    def n_neighbors(self):
+        return self.indexes.shape[1] - 1
+
+    @property
+    def nbytes(self):
+        """Memory of precomputed neighbors (and of traces if they were
+        copied)."""
+        nbytes = self.distances.nbytes + self.indexes.nbytes
+        if self.data.flags.owndata:
+            nbytes += self.data.nbytes
+        return nbytes
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            self._search_index = NearestNeighbors(
+                algorithm=self.algorithm, leaf_size=self.leaf_size).fit(self.data)
+        return self._search_index
+
+    def training_neighbors(self, n_neighbors):
+        """(distances, indexes) of n_neighbors nearest neighbors of every
+        training trace, trace itself is in the first column and it is not
+        counted in n_neighbors."""
+        return self.distances[:, :n_neighbors+1], self.indexes[:, :n_neighbors+1]
+
+    def kneighbors_graph(self, n_neighbors):
+        """Sparse graph of distances to n_neighbors nearest neighbors of
+        every training trace (trace itself is stored too, as in
+        KNeighborsTransformer with mode="distance"), it can be passed to
+        sklearn estimators with metric="precomputed"."""
+        distances, indexes = self.training_neighbors(n_neighbors)
+        n_samples, n_columns = indexes.shape
+        return csr_matrix(
+            (distances.ravel(), indexes.ravel(), np.arange(0, n_samples * n_columns + 1, n_columns)),
+            shape=(n_samples, n_samples))
+
+    def kneighbors(self, X, n_neighbors):
+        """(distances, indexes) of n_neighbors nearest training traces of
+        traces X."""
+        return self.search_index.kneighbors(X, n_neighbors)
+
+
+def neighbors_index_bytes(n_traces, n_neighbors):
+    """Memory of precomputed neighbors of n_traces traces (distances and
+    indexes, without traces themselves)."""
+    n_neighbors = min(n_neighbors, n_traces - 1)
+    return n_traces * (n_neighbors + 1) * 2 * 8
+
+
+# graphs of this process by their token, so all pickled copies of a graph
+# (e.g. in tasks sent to the same worker process) are unpickled as one graph
+_shared_graphs = weakref.WeakValueDictionary()
+
+
+def _shared_graph(token, params):
+    graph = _shared_graphs.get(token)
+    if graph is None:
+        graph = NeighborsGraph(**params)
+        graph._token = token
+        _shared_graphs[token] = graph
+    return graph
+
+
+class NeighborsGraph:
+    """Nearest neighbors graphs of training traces shared by manifold
+    reducers.
+
+    Neighbors of training traces are computed once (for the largest
+    requested number of neighbors, at least max_n_neighbors) and reducers
+    with smaller n_neighbors use first columns of the same graph. Graphs
+    are looked up by content hash of traces, so all reducers fitted on
+    the same cross validation fold share one graph. Graphs are kept until
+    clear is called (e.g. after every experiment, a grid search refits
+    every fold for every grid point, so all graphs of its CV folds have
+    to be kept), if max_bytes is given least recently used graphs are
+    dropped when graphs take more memory (the last graph is always
+    kept).
+
+    Like FoldStatistics it is shared (not copied) between clones of
+    estimators that use it (e.g. in grid search). Pickled graph doesn't
+    contain computed graphs and all its copies unpickled in one process
+    are the same object.
+
+    Args:
+        max_n_neighbors (int): number of neighbors computed for every
+            graph, usually the largest n_neighbors of parameter grid (can
+            be changed between experiments, graphs with enough neighbors
+            are reused)
+        max_bytes (int): memory of kept graphs (no limit if None), see
+            neighbors_index_bytes
+        algorithm (str): search index for other traces, see NeighborsIndex
+        leaf_size (int): leaf size of tree index
+    """
+
+    def __init__(self, max_n_neighbors=None, max_bytes=None, algorithm="auto", leaf_size=40):
+        self.max_n_neighbors = max_n_neighbors
+        self.max_bytes = max_bytes
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+
+        self._indexes = OrderedDict()
+
+        self._token = uuid.uuid4().hex
+        _shared_graphs[self._token] = self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return _shared_graph, (self._token, {
+            "max_n_neighbors": self.max_n_neighbors,
+            "max_bytes": self.max_bytes,
+            "algorithm": self.algorithm,
+            "leaf_size": self.leaf_size,
+        })
+
+    def index(self, X, n_neighbors):
+        """NeighborsIndex of traces X with at least n_neighbors neighbors."""
+        data = np.ascontiguousarray(X, dtype=np.float64)
+        key = joblib.hash(data)
+
+        index = self._indexes.get(key)
+        if index is None or index.n_neighbors < min(n_neighbors, len(data) - 1):
+            n_neighbors = max(n_neighbors, self.max_n_neighbors or 0)
+            index = NeighborsIndex(
+                data, min(n_neighbors, len(data) - 1), self.algorithm, self.leaf_size)
+            self._indexes[key] = index
+
+        self._indexes.move_to_end(key)
+        while (self.max_bytes is not None and len(self._indexes) > 1
+               and sum(index.nbytes for index in self._indexes.values()) > self.max_bytes):
+            self._indexes.popitem(last=False)
+
+        return index
+
+    def clear(self):
+        """Drops all computed graphs."""
+        self._indexes.clear()
@@ -0,0 +1,129 @@
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is not measured there
+    resource = None
+
+
+def _peak_rss():
+    # peak resident set size of this process in bytes (kilobytes on Linux)
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Profiler:
+    """Wall time, CPU time and memory of stages of experiment.
+
+    Every stage (with profiler.stage(name)) is recorded with current fold
+    label (fold index, "all" for refit on all training traces, "attack",
+    ...), which is set by utils.sklearn_wrappers.ProfiledEstimator when
+    pipeline is fitted or by caller. Label is kept until it is set again, so it assumes that folds
+    are fitted and scored one after another (GridSearchCV with
+    n_jobs=None).
+
+    Memory is measured as increase of peak RSS of process during stage
+    and, if trace_allocations is True, as peak of memory allocated by
+    Python and numpy during stage (tracemalloc, slows down allocations).
+
+    Like StageCache it is shared (not copied) between clones of estimators
+    that use it.
+
+    Args:
+        trace_allocations (bool): measure peak allocations with tracemalloc
+    """
+
+    def __init__(self, trace_allocations=False):
+        self.trace_allocations = trace_allocations
+        self.fold = None
+        self.records = []
+
+        # (allocated at start, peak of finished nested stages) of running
+        # stages, tracemalloc has only one peak that is reset by every stage
+        self._allocations = []
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _start_allocations(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._allocations:
+            start, nested_peak = self._allocations[-1]
+            self._allocations[-1] = (start, max(nested_peak, peak))
+        tracemalloc.reset_peak()
+        self._allocations.append((current, 0))
+
+    def _stop_allocations(self):
+        _, peak = tracemalloc.get_traced_memory()
+        start, nested_peak = self._allocations.pop()
+        peak = max(peak, nested_peak)
+        if self._allocations:
+            parent_start, parent_peak = self._allocations[-1]
+            self._allocations[-1] = (parent_start, max(parent_peak, peak))
+        tracemalloc.reset_peak()
+        return peak - start
+
+    @contextmanager
+    def stage(self, name, method=None):
+        """Records stage (method is e.g. "fit" or "transform")."""
+        started_tracing = False
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            self._start_allocations()
+
+        start_rss = _peak_rss()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "method": method,
+                "fold": self.fold,
+                "wall": time.perf_counter() - start_wall,
+                "cpu": time.process_time() - start_cpu,
+            }
+
+            peak_rss = _peak_rss()
+            if peak_rss is not None:
+                record["peak_rss"] = peak_rss
+                record["rss_increase"] = peak_rss - start_rss
+            if self.trace_allocations:
+                record["peak_allocated"] = self._stop_allocations()
+                if started_tracing:
+                    tracemalloc.stop()
+
+            self.records.append(record)
+
+    def summary(self):
+        """Records summed over calls of the same stage, method and fold
+        (times are summed, memory is maximum of calls)."""
+        summary = {}
+        for record in self.records:
+            key = (record["stage"], record["method"], str(record["fold"]))
+            total = summary.get(key)
+            if total is None:
+                summary[key] = dict(record, calls=1)
+                continue
+
+            total["calls"] += 1
+            for name, value in record.items():
+                if name in ("wall", "cpu"):
+                    total[name] += value
+                elif name in ("peak_rss", "rss_increase", "peak_allocated"):
+                    total[name] = max(total[name], value)
+
+        return list(summary.values())
+
+
+def profile_stage(profiler, name, method=None):
+    """profiler.stage(name, method), or no-op context if profiler is None."""
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, method)
@@ -0,0 +1,84 @@
+import importlib
+import inspect
+from functools import lru_cache
+
+# name of reducer -> (module, class, fixed parameters), modules are
+# imported only when reducer is first used (umap takes seconds to import)
+REDUCERS = {
+    "sod": ("utils.feature_selection", "SumOfDifferenceFeatureSelector", {}),
+    "pca": ("sklearn.decomposition", "PCA", {}),
+    "lda": ("utils.discriminant", "FisherDiscriminantReducer", {"solver": "eigen"}),
+    "class_means": ("utils.discriminant", "FisherDiscriminantReducer", {"solver": "class_means"}),
+    "isomap": ("utils.manifold", "SharedNeighborsIsomap", {}),
+    "lle": ("utils.manifold", "SharedNeighborsLocallyLinearEmbedding", {"method": "standard"}),
+    "mlle": ("utils.manifold", "SharedNeighborsLocallyLinearEmbedding", {"method": "modified"}),
+    "hlle": ("utils.manifold", "SharedNeighborsLocallyLinearEmbedding", {"method": "hessian"}),
+    "ltsa": ("utils.manifold", "SharedNeighborsLocallyLinearEmbedding", {"method": "ltsa"}),
+    "landmark_isomap": ("utils.manifold", "LandmarkIsomap", {}),
+    "landmark_lle": ("utils.manifold", "LandmarkLocallyLinearEmbedding", {"method": "standard"}),
+    "landmark_ltsa": ("utils.manifold", "LandmarkLocallyLinearEmbedding", {"method": "ltsa"}),
+    "umap": ("utils.manifold_umap", "SharedNeighborsUMAP", {}),
+}
+
+# reducers with at most n_classes - 1 components (n_classes of output
+# classes of leakage model)
+CLASS_LIMITED_REDUCERS = {"lda", "class_means"}
+
+
+def reducer_class(name):
+    """Class of reducer (its module is imported on first use)."""
+    try:
+        module_name, class_name, _ = REDUCERS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown reducer {name}, available are {', '.join(REDUCERS)}"
+        ) from None
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def reducer_parameters(name):
+    """Names of parameters of reducer (parameters of its __init__, as in
+    sklearn get_params)."""
+    return [
+        parameter.name
+        for parameter in inspect.signature(reducer_class(name).__init__).parameters.values()
+        if parameter.name != "self" and parameter.kind != parameter.VAR_KEYWORD
+    ]
+
+
+def preload(names):
+    """Imports modules of reducers, e.g. before worker processes are
+    forked, so they are imported only once."""
+    for name in names:
+        reducer_class(name)
+
+
+@lru_cache(maxsize=None)
+def shared_neighbors_graph():
+    """NeighborsGraph shared by all manifold reducers of this process."""
+    from utils.neighbors import NeighborsGraph
+    return NeighborsGraph()
+
+
+def clear_shared_neighbors_graph():
+    """Drops graphs of shared NeighborsGraph (if it was created)."""
+    if shared_neighbors_graph.cache_info().currsize:
+        shared_neighbors_graph().clear()
+
+
+def make_reducer(name, params=None, max_n_neighbors=None):
+    """Reducer name with params (and fixed parameters of reducer).
+
+    Reducers that accept neighbors_graph get NeighborsGraph shared by
+    this process, which then computes max_n_neighbors neighbors (usually
+    the largest n_neighbors of grid of the experiment, experiments of one
+    process are run one by one).
+    """
+    cls = reducer_class(name)
+    params = {**REDUCERS[name][2], **(params or {})}
+
+    if "neighbors_graph" in reducer_parameters(name) and "neighbors_graph" not in params:
+        params["neighbors_graph"] = shared_neighbors_graph()
+        params["neighbors_graph"].max_n_neighbors = max_n_neighbors
+
+    return cls(**params)
@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from utils.run_manifest import describe_value
+
+
+def cv_results_arrays(cv_results):
+    """Columns of GridSearchCV.cv_results_ as typed arrays (numeric columns
+    as float64, other columns as strings), prefixed with "cv_"."""
+    arrays = {}
+    for name, values in cv_results.items():
+        if name == "params":
+            # same values are in param_* columns
+            continue
+
+        values = np.ma.getdata(values)
+        try:
+            arrays["cv_" + name] = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            arrays["cv_" + name] = np.asarray(values).astype(str)
+
+    return arrays
+
+
+class ResultsStore:
+    """Results of experiments stored as typed arrays with metadata.
+
+    Arrays of every experiment are stored in their own npz shard (written
+    atomically), metadata of all experiments in append only JSON lines
+    index. Queries read only index, arrays are loaded on demand.
+
+    Args:
+        directory: directory of store (created if it doesn't exist)
+    """
+
+    INDEX_FILE = "index.jsonl"
+    SHARDS_DIR = "shards"
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        (self.directory/self.SHARDS_DIR).mkdir(parents=True, exist_ok=True)
+
+        self._entries = {}
+        self._index_position = 0
+
+    @property
+    def index_file(self):
+        return self.directory/self.INDEX_FILE
+
+    def _read_index(self):
+        # reads only lines appended since last read
+        if not self.index_file.exists():
+            return
+
+        with open(self.index_file) as file:
+            file.seek(self._index_position)
+            for line in file:
+                if not line.endswith("\n"):
+                    # line that is still being written
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._entries[entry["key"]] = entry
+            self._index_position = file.tell()
+
+    def append(self, key, arrays=None, **metadata):
+        """Stores arrays (dict name -> array) and metadata of experiment,
+        previous results with the same key are replaced."""
+        entry = {"key": key, **describe_value(metadata)}
+
+        if arrays:
+            shard = f"{self.SHARDS_DIR}/{key}.npz"
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory/self.SHARDS_DIR, prefix=".tmp_")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    np.savez(file, **arrays)
+                os.replace(tmp_path, self.directory/shard)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            entry["shard"] = shard
+            entry["arrays"] = sorted(arrays)
+
+        with open(self.index_file, "a") as file:
+            file.write(json.dumps(entry, sort_keys=True) + "\n")
+
+        self._entries[key] = entry
+
+    def query(self, **filters):
+        """Metadata of experiments whose metadata match all filters (values
+        or collections of accepted values)."""
+        self._read_index()
+
+        def matches(entry, name, accepted):
+            if isinstance(accepted, (list, tuple, set)):
+                return entry.get(name) in accepted
+            return entry.get(name) == accepted
+
+        return [
+            entry for entry in self._entries.values()
+            if all(matches(entry, name, accepted) for name, accepted in filters.items())
+        ]
+
+    def load(self, entry, names=None):
+        """Arrays of experiment (entry returned by query), only given names
+        are read if names is not None."""
+        if "shard" not in entry:
+            return {}
+
+        with np.load(self.directory/entry["shard"]) as shard:
+            names = shard.files if names is None else names
+            return {name: shard[name] for name in names}
+
+    def __len__(self):
+        self._read_index()
+        return len(self._entries)
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+
+def describe_value(value):
+    """JSON serializable description of parameter value that doesn't
+    change between runs (objects are described by their type only)."""
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return value
+    if isinstance(value, (tuple, list)):
+        return [describe_value(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): describe_value(v) for k, v in value.items()}
+    if isinstance(value, slice):
+        return [value.start, value.stop, value.step]
+    if hasattr(value, "get_params") and not isinstance(value, type):
+        # sklearn estimators (checked without importing sklearn)
+        return {
+            "class": type(value).__name__,
+            "params": describe_value(value.get_params(deep=False)),
+        }
+    if hasattr(value, "item"):
+        # numpy scalars
+        return value.item()
+    return type(value).__name__
+
+
+def stable_hash(description):
+    """Hash of description (e.g. dataset, leakage model, parameters of
+    experiment) that is the same in every run."""
+    text = json.dumps(describe_value(description), sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def write_atomic(path, text):
+    """Writes text to path, file is replaced only after it is fully
+    written (interrupted write never leaves partial file)."""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class RunManifest:
+    """Status of every experiment of run, stored as append only JSON lines
+    (last entry of experiment wins), so it survives interrupted runs.
+
+    Experiments are identified by stable_hash of their description.
+    Status is "running" when experiment is started, "done" or "failed"
+    when its result is written.
+    """
+
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of interrupted run may be incomplete
+                    continue
+                self.entries[entry["key"]] = entry
+
+    def status(self, key):
+        entry = self.entries.get(key)
+        return None if entry is None else entry["status"]
+
+    def is_finished(self, key):
+        return self.status(key) in (self.DONE, self.FAILED)
+
+    def mark(self, key, status, **info):
+        entry = {"key": key, "status": status, **describe_value(info)}
+        self.entries[key] = entry
+
+        with open(self.path, "a") as file:
+            file.write(json.dumps(entry, sort_keys=True) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
@@ -0,0 +1,185 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+# environment variables read by BLAS/OpenMP libraries when they are loaded
+_THREAD_VARIABLES = (
+    "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS", "NUMBA_NUM_THREADS",
+)
+
+
+class SharedArrays:
+    """Nested tuples of numpy arrays (e.g. loaded dataset) copied to shared
+    memory, so worker processes attach to them instead of receiving
+    pickled copies.
+
+    handle is small picklable description of arrays, attach_arrays(handle)
+    returns read only arrays backed by shared memory. Shared memory is
+    released when SharedArrays is closed (use it as context manager).
+    """
+
+    def __init__(self, arrays):
+        self._blocks = []
+        self.handle = self._share(arrays)
+
+    def _share(self, arrays):
+        if isinstance(arrays, (tuple, list)):
+            return tuple(self._share(array) for array in arrays)
+
+        array = np.ascontiguousarray(arrays)
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._blocks.append(block)
+
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        return (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# shared memory blocks attached by this process (kept open while it runs)
+_attached_blocks = {}
+
+
+def attach_arrays(handle):
+    """Arrays described by SharedArrays.handle."""
+    if isinstance(handle[0], tuple):
+        return tuple(attach_arrays(h) for h in handle)
+
+    name, shape, dtype = handle
+    block = _attached_blocks.get(name)
+    if block is None:
+        # workers share resource tracker of process that created block,
+        # so block is unlinked only by its owner
+        block = SharedMemory(name=name)
+        _attached_blocks[name] = block
+
+    array = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+    array.flags.writeable = False
+    return array
+
+
+def available_memory():
+    """Memory available for new processes in bytes (total physical
+    memory if available memory is unknown, None if both are unknown)."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def workers_for_memory(worker_bytes, memory_bytes=None, max_workers=None):
+    """Number of workers (at least 1, at most max_workers, all cpus by
+    default) that fit into memory_bytes (available memory by default)
+    if every worker needs worker_bytes."""
+    max_workers = max_workers or os.cpu_count() or 1
+    memory_bytes = memory_bytes or available_memory()
+    if memory_bytes is None:
+        return 1
+    return max(1, min(max_workers, int(memory_bytes // max(worker_bytes, 1))))
+
+
+def threads_per_worker(n_workers, n_threads=None):
+    """BLAS/OpenMP threads of every worker, so workers together use at
+    most n_threads (all cpus by default)."""
+    n_threads = n_threads or os.cpu_count() or 1
+    return max(1, n_threads // n_workers)
+
+
+def _init_worker(n_threads):
+    for variable in _THREAD_VARIABLES:
+        os.environ[variable] = str(n_threads)
+    threadpool_limits(limits=n_threads)
+
+
+def _run_on_pool(function, queue, n_workers, n_threads, on_start):
+    # runs tasks of queue (deque), at most n_workers at once, yields
+    # (task, result) and returns tasks that were running when pool broke
+    executor = ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(threads_per_worker(n_workers, n_threads),)
+    )
+    futures = {}
+    with executor:
+        while queue or futures:
+            while queue and len(futures) < n_workers:
+                task = queue.popleft()
+                if on_start is not None:
+                    on_start(task)
+                futures[executor.submit(function, task)] = task
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    return list(futures.values())
+                yield futures.pop(future), result
+
+    return []
+
+
+def run_tasks(function, tasks, n_workers=None, n_threads=None, on_start=None,
+              crash_result=None):
+    """Runs function(task) for every task on pool of n_workers processes
+    (in this process if n_workers is None).
+
+    Every worker uses threads_per_worker(n_workers, n_threads) BLAS
+    threads, so workers don't oversubscribe cpus. At most n_workers tasks
+    are submitted at once and on_start(task) is called when task is
+    submitted.
+
+    If worker process dies (e.g. it is killed when memory runs out), all
+    tasks that were running are run again one by one on new pools, task
+    that breaks pool again gets crash_result(task, message) as result
+    (BrokenProcessPool is raised if crash_result is None). Other tasks
+    continue on new pool.
+
+    Yields:
+        (task, result) in order in which tasks finish
+    """
+    if n_workers is None:
+        for task in tasks:
+            if on_start is not None:
+                on_start(task)
+            yield task, function(task)
+        return
+
+    queue = deque(tasks)
+    while queue:
+        suspects = yield from _run_on_pool(function, queue, n_workers, n_threads, on_start)
+
+        # worker died, so one of tasks that were running killed it
+        for task in suspects:
+            crashed = yield from _run_on_pool(function, deque([task]), 1, n_threads, on_start)
+            if crashed:
+                message = "Worker process terminated abruptly (e.g. it ran out of memory)"
+                if crash_result is None:
+                    raise BrokenProcessPool(message)
+                yield task, crash_result(task, message)
@@ -1,4 +1,5 @@
 from sklearn.base import TransformerMixin, BaseEstimator
+from sklearn.utils.metaestimators import available_if
 import numpy as np
 
 
@@ -44,3 +45,124 @@ class TransformedTargetTransformer(TransformerMixin, BaseEstimator):
 
     def set_params(self, **kwargs):
         return self.transformer.set_params(**kwargs)
+
+
+class TraceData:
+    """Traces with plaintext side channel, used as X in pipelines instead
+    of (traces | plain_text) matrix, so traces keep their dtype and are
+    never copied just to append plaintext column.
+
+    Indexing rows (as done by sklearn model selection) returns TraceData
+    with selected rows of traces and plaintext.
+
+    Args:
+        traces: array with shape (n_traces, n_features)
+        plaintext: array with shape (n_traces,)
+        dtype: if given traces are converted to dtype (e.g. np.float32)
+    """
+
+    ndim = 2
+
+    def __init__(self, traces, plaintext, dtype=None):
+        self.traces = traces if dtype is None else np.asarray(traces, dtype=dtype)
+        self.plaintext = np.asarray(plaintext)
+
+    @property
+    def shape(self):
+        return self.traces.shape
+
+    def __len__(self):
+        return len(self.traces)
+
+    def __getitem__(self, item):
+        if isinstance(item, tuple) and len(item) == 2 and item[1] is Ellipsis:
+            item = item[0]
+        return TraceData(self.traces[item], self.plaintext[item])
+
+    def with_traces(self, traces):
+        return TraceData(traces, self.plaintext)
+
+
+class TracesTransformer(TransformerMixin, BaseEstimator):
+    """Applies transformer to traces of TraceData, plaintext is passed
+    through unchanged."""
+
+    def __init__(self, transformer):
+        self.transformer = transformer
+
+    def fit(self, X, y=None, **fit_params):
+        self.transformer.fit(X.traces, y, **fit_params)
+        return self
+
+    def transform(self, X):
+        return X.with_traces(self.transformer.transform(X.traces))
+
+    def fit_transform(self, X, y=None, **fit_params):
+        return X.with_traces(self.transformer.fit_transform(X.traces, y, **fit_params))
+
+    def set_params(self, **kwargs):
+        return self.transformer.set_params(**kwargs)
+
+
+def _estimator_has(method):
+    return lambda self: hasattr(self.estimator, method)
+
+
+class ProfiledEstimator(BaseEstimator):
+    """Estimator (pipeline step) whose fit, transform and predict calls are
+    recorded by profiler (utils.profiling.Profiler) as stage name.
+
+    Parameters of wrapped estimator are set through wrapper (like with
+    TransformedTargetTransformer), so parameter names of pipeline don't
+    change when its steps are wrapped.
+
+    If folds (FoldStatistics) are given, fit sets fold label of profiler
+    to fold whose training traces are fitted, so wrap whole model with
+    folds and its steps without them.
+    """
+
+    def __init__(self, estimator, profiler, name, folds=None):
+        self.estimator = estimator
+        self.profiler = profiler
+        self.name = name
+        self.folds = folds
+
+    @property
+    def _estimator_type(self):
+        return getattr(self.estimator, "_estimator_type", None)
+
+    def _set_fold(self, X):
+        if self.folds is not None:
+            traces = getattr(X, "traces", X)
+            self.profiler.fold = self.folds.fold_index(traces)
+
+    def fit(self, X, y=None, **fit_params):
+        self._set_fold(X)
+        with self.profiler.stage(self.name, "fit"):
+            self.estimator.fit(X, y, **fit_params)
+        return self
+
+    @available_if(_estimator_has("transform"))
+    def fit_transform(self, X, y=None, **fit_params):
+        self._set_fold(X)
+        with self.profiler.stage(self.name, "fit_transform"):
+            return self.estimator.fit_transform(X, y, **fit_params)
+
+    @available_if(_estimator_has("transform"))
+    def transform(self, X):
+        with self.profiler.stage(self.name, "transform"):
+            return self.estimator.transform(X)
+
+    @available_if(_estimator_has("predict"))
+    def predict(self, X):
+        with self.profiler.stage(self.name, "predict"):
+            return self.estimator.predict(X)
+
+    @available_if(_estimator_has("predict_proba"))
+    def predict_proba(self, X):
+        with self.profiler.stage(self.name, "predict_proba"):
+            return self.estimator.predict_proba(X)
+
+    def set_params(self, **kwargs):
+        self.estimator.set_params(**kwargs)
+        return self
@@ -0,0 +1,165 @@
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin, clone
+
+
+class StageCache:
+    """Content addressed LRU cache of fitted pipeline stages and their
+    outputs.
+
+    Entries are kept in memory until max_bytes (size of cached arrays) is
+    exceeded, least recently used arrays are then moved to directory (if
+    given) which is itself limited to max_disk_bytes, other evicted
+    entries are dropped.
+
+    Cache is shared (not copied) between clones of estimators that use it
+    (e.g. in grid search). It is not shared between processes.
+    """
+
+    def __init__(self, max_bytes=2**30, directory=None, max_disk_bytes=2**33):
+        self.max_bytes = max_bytes
+        self.directory = None if directory is None else Path(directory)
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()  # key -> (value, size)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> size
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return self._memory[key][0]
+
+        if key in self._disk:
+            value = joblib.load(self._disk_file(key))
+            self._remove_from_disk(key)
+            self.put(key, value)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        size = _nbytes(value)
+
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+
+        # evict least recently used entries
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            old_key, (old_value, old_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= old_size
+            self._spill_to_disk(old_key, old_value, old_size)
+
+    def _disk_file(self, key):
+        return self.directory/f"{key}.pkl"
+
+    def _spill_to_disk(self, key, value, size):
+        if (self.directory is None or not isinstance(value, np.ndarray)
+                or size > self.max_disk_bytes):
+            return
+
+        joblib.dump(value, self._disk_file(key))
+        self._disk[key] = size
+        self._disk_bytes += size
+
+        while self._disk_bytes > self.max_disk_bytes:
+            old_key = next(iter(self._disk))
+            self._remove_from_disk(old_key)
+
+    def _remove_from_disk(self, key):
+        self._disk_bytes -= self._disk.pop(key)
+        try:
+            os.remove(self._disk_file(key))
+        except FileNotFoundError:
+            pass
+
+
+def _nbytes(value):
+    # only size of arrays is counted, fitted transformers are small
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 0
+
+
+def _param_token(value):
+    # arrays and plain values are hashed by content, other objects (shared
+    # statistics, output functions, ...) by identity
+    if isinstance(value, (np.ndarray, str, bytes, int, float, bool, type(None))):
+        return joblib.hash(value)
+    if isinstance(value, (tuple, list)):
+        return tuple(_param_token(v) for v in value)
+    return f"{type(value).__name__}@{id(value)}"
+
+
+def _estimator_key(estimator):
+    params = estimator.get_params(deep=True)
+    return joblib.hash((
+        type(estimator).__name__,
+        [(name, _param_token(value)) for name, value in sorted(params.items())
+         if not isinstance(value, BaseEstimator)]
+    ))
+
+
+class CachedTransformer(TransformerMixin, BaseEstimator):
+    """Transformer whose fit_transform and transform results are stored in
+    StageCache. Key of fit is hash of transformer parameters and training
+    data, so refitting the same stage on the same fold (e.g. for every grid
+    point of grid search) only looks it up.
+    """
+
+    def __init__(self, transformer, cache):
+        self.transformer = transformer
+        self.cache = cache
+
+    def _fit_key(self, X, y):
+        return joblib.hash((_estimator_key(self.transformer), X, y))
+
+    def fit(self, X, y=None):
+        self.fit_transform(X, y)
+        return self
+
+    def fit_transform(self, X, y=None):
+        self.fit_key_ = self._fit_key(X, y)
+
+        # fitted transformer and its output are cached separately, so output
+        # can be moved to disk
+        transformer = self.cache.get(self.fit_key_ + "_transformer")
+        Xt = self.cache.get(self.fit_key_) if transformer is not None else None
+        if Xt is None:
+            transformer = clone(self.transformer)
+            Xt = transformer.fit_transform(X, y)
+            self.cache.put(self.fit_key_ + "_transformer", transformer)
+            self.cache.put(self.fit_key_, Xt)
+
+        self.transformer_ = transformer
+        return Xt
+
+    def transform(self, X):
+        key = joblib.hash((self.fit_key_, X))
+
+        Xt = self.cache.get(key)
+        if Xt is None:
+            Xt = self.transformer_.transform(X)
+            self.cache.put(key, Xt)
+
+        return Xt